@@ -1,13 +1,26 @@
 import datetime
+from typing import Literal
 
 import requests
 from platformdirs import user_cache_path
 
+from asof.aio import aget_conda as aget_conda
+from asof.aio import aget_pypi as aget_pypi
 from asof.conda import get_conda as get_conda
 from asof.pypi import get_pypi as get_pypi
 
 # TODO: Below should be a standalone config file
 pypi_baseurl = "https://pypi.org"
+# Mirrors of the simple index at pypi_baseurl, to ask in order if it is slow
+# or failing. A request that hasn't been answered within pypi_hedge_delay
+# seconds (or, once there are enough timings, the 95th percentile of the
+# mirror's response times) is also sent to the next mirror, and the first
+# good answer wins
+pypi_mirrors: list[str] = []
+pypi_hedge_delay = 1.0
+# Skip a mirror for mirror_cooldown seconds after this many failures in a row
+mirror_failure_limit = 3
+mirror_cooldown = 30.0
 downloads = {
     "name_mapping": requests.Request(
         "GET",
@@ -15,5 +28,38 @@ downloads = {
         headers={"Accept": "application/json"},
     ).prepare(),
 }
+conda_channel_baseurl = "https://conda.anaconda.org"
+conda_channels = ["conda-forge"]
+# None means the host platform's subdir plus noarch
+conda_subdirs: list[str] | None = None
+# How to merge the releases of several channels: "strict" only considers the
+# first channel that has the package, "flexible" considers them all
+conda_channel_priority: Literal["strict", "flexible"] = "flexible"
+# Ways of querying conda channels, in order of preference. For each channel
+# subdir, each one falls back to the next if it isn't available (say, the
+# channel doesn't serve shards). "conda-cache" reads the repodata conda itself
+# cached, if recent enough; "conda-api" queries through conda's Python API, if
+# asof is installed alongside conda; "search" uses the conda search command.
+conda_backends = ["conda-cache", "conda-api", "shards", "repodata", "search"]
+# Keep repodata up to date with the incremental repodata.jlap patches
+conda_use_jlap = True
+# How long to reuse conda search output before running the search again
+conda_search_lifetime = datetime.timedelta(hours=1)
+# How long to reuse the repodata conda's Python API loaded before reloading it
+conda_api_lifetime = datetime.timedelta(hours=1)
+# Which prereleases to report: "newer" (only if newer than the newest
+# release), "never", or "always" (report the newest version, whatever it is)
+prereleases: Literal["newer", "never", "always"] = "newer"
+# Seconds to wait to connect to a server, and then between bytes received
+http_timeout = (10.0, 60.0)
+# How many times to retry a request that fails to connect or gets a server
+# error (like 503), and the base of the exponential backoff between tries
+http_retries = 3
+http_backoff = 0.5
+# Most requests per second to send to any one host, across all threads
+http_rate_limit = 20.0
+# Most requests to have in flight to any one host. Fewer are sent while the
+# server is pushing back with 429 or 503 responses
+http_max_concurrency = 16
 cache_path = user_cache_path() / "python-asof" / "cache.db"
 cache_lifetime = datetime.timedelta(days=1)
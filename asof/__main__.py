@@ -1,27 +1,71 @@
 import argparse
 import datetime
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Literal
 
 from rich.console import Console
 
+import asof
+from asof.batch import default_max_workers, read_queries, submit_lookups
 from asof.canonical_names import CanonicalNames
-from asof.conda import get_conda as get_conda
-from asof.pypi import get_pypi as get_pypi
+from asof.tags import parse_target
 
 
 def main():
     console = Console()
     options = get_options()
-
-    canonical_names = CanonicalNames.from_options(options, console)
-    console.print(
-        f"Query: [bold]{options.query}[/bold] [gray]({options.query_type} name)[/gray]",
-        highlight=False,
-    )
-    console.print(canonical_names.pretty, highlight=False)
-
-    get_pypi(options.when, canonical_names.pypi_name).log(console)
-    get_conda(options.when, canonical_names.conda_name).log(console)
+    if options.channel:
+        asof.conda_channels = options.channel
+    if options.channel_priority is not None:
+        asof.conda_channel_priority = options.channel_priority
+    if options.prereleases is not None:
+        asof.prereleases = options.prereleases
+
+    queries = get_queries(options)
+    if not queries:
+        get_parser().error("no packages given to search for")
+
+    names = [
+        CanonicalNames.from_query(query, options.query_type, console)
+        for query in queries
+    ]
+
+    with (
+        console.status(f"Querying {len(queries)} package(s)"),
+        ThreadPoolExecutor(options.jobs) as executor,
+    ):
+        lookups = submit_lookups(
+            executor,
+            options.when,
+            names,
+            options.recheck_yanked,
+            options.platform,
+            options.target,
+        )
+        for query, canonical_names, futures in zip(queries, names, lookups):
+            console.print(
+                f"Query: [bold]{query}[/bold] [gray]({options.query_type} name)[/gray]",
+                highlight=False,
+            )
+            console.print(canonical_names.pretty, highlight=False)
+            # Print each source's result as soon as it arrives
+            for future in as_completed(futures):
+                future.result().log(console)
+
+
+def get_queries(options: argparse.Namespace) -> list[str]:
+    """Collect queries from the command line, requirements files, and stdin."""
+    queries = list(options.query)
+    for path in options.requirement:
+        if path == "-":
+            queries.extend(read_queries(sys.stdin))
+        else:
+            with open(path) as f:
+                queries.extend(read_queries(f))
+    if not queries and not options.requirement and not sys.stdin.isatty():
+        queries.extend(read_queries(sys.stdin))
+    return queries
 
 
 def datetime_fromisoformat_here(s: str) -> datetime.datetime:
@@ -42,7 +86,15 @@ def get_parser() -> argparse.ArgumentParser:
     )
     parser.add_argument(
         "query",
-        help='Package name (or import name, if query type is "import") to search for latest version.',
+        help='Package names (or import names, if query type is "import") to search for latest version. If none are given, names are read from stdin.',
+        nargs="*",
+    )
+    parser.add_argument(
+        "-r",
+        "--requirement",
+        help='Read package names from a requirements file ("-" for stdin). May be given more than once.',
+        action="append",
+        default=[],
     )
     parser.add_argument(
         "--query-type",
@@ -52,6 +104,48 @@ def get_parser() -> argparse.ArgumentParser:
         default="pypi",
         type=as_query_type,
     )
+    parser.add_argument(
+        "-c",
+        "--channel",
+        help=f"Conda channel to search (default: {', '.join(asof.conda_channels)}). May be given more than once, highest priority first.",
+        action="append",
+        default=[],
+    )
+    parser.add_argument(
+        "--channel-priority",
+        help=f'How to combine several conda channels, as in conda (default: "{asof.conda_channel_priority}"). With "strict", only the first channel that has the package is considered.',
+        choices=["strict", "flexible"],
+    )
+    parser.add_argument(
+        "--platform",
+        help="Conda platform (subdir) to answer for, like linux-64, osx-arm64, or win-64. May be given more than once to get an answer per platform (default: this machine's platform).",
+        action="append",
+        default=[],
+    )
+    parser.add_argument(
+        "--target",
+        help="PyPI target environment to find compatible wheels for, as interpreter-platform, like cp311-manylinux_2_28_x86_64 or cp312-macosx_14_0_arm64. May be given more than once to get an answer per target (default: this interpreter).",
+        action="append",
+        default=[],
+        type=as_target,
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help=f"Maximum number of lookups to run at once (default: {default_max_workers}).",
+        type=int,
+        default=default_max_workers,
+    )
+    parser.add_argument(
+        "--prereleases",
+        help=f'Which prereleases to report (default: "{asof.prereleases}"). With "newer", the newest prerelease is reported if it is newer than the newest release; with "always", only the newest version is reported, prerelease or not.',
+        choices=["newer", "never", "always"],
+    )
+    parser.add_argument(
+        "--recheck-yanked",
+        help="Revalidate cached package pages even if they were fetched after the cutoff. Only needed to pick up files yanked (or removed from conda channels) since the page was cached.",
+        action="store_true",
+    )
     return parser
 
 
@@ -74,5 +168,10 @@ def as_query_type(maybe_query_type: str) -> QueryType:
             raise ValueError
 
 
+def as_target(maybe_target: str) -> str:
+    parse_target(maybe_target)
+    return maybe_target
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,188 @@
+"""Async versions of the lookups.
+
+Only conda search runs natively on the event loop, as a subprocess. The other
+lookups do blocking HTTP and SQLite I/O and run on threads, so at least they
+don't block the loop; there's no async HTTP dependency to do better.
+"""
+
+import asyncio
+import datetime
+from collections.abc import AsyncIterator, Iterable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+
+from packaging.specifiers import SpecifierSet
+
+from asof.batch import default_max_workers, submit_lookups
+from asof.canonical_names import CanonicalNames
+from asof.conda import (
+    CondaCommand,
+    get_conda,
+    get_conda_platforms,
+    index_search,
+    no_conda_command,
+    search_command,
+    search_is_fresh,
+    search_matches,
+)
+from asof.db import get_local_con
+from asof.package_match import MatchesOption, PlatformMatches
+from asof.pypi import get_pypi, get_pypi_targets
+from asof.repodata import RepodataUnavailable
+
+
+async def aget_pypi(
+    when: datetime.datetime,
+    package: str,
+    recheck_yanked: bool = False,
+    specifier: SpecifierSet | str | None = None,
+) -> MatchesOption:
+    """Like get_pypi, but without blocking the event loop.
+
+    The lookup runs on the loop's default executor, which bounds how many run
+    at once.
+    """
+    return await asyncio.to_thread(get_pypi, when, package, recheck_yanked, specifier)
+
+
+async def aget_pypi_targets(
+    when: datetime.datetime,
+    package: str,
+    targets: Sequence[str],
+    recheck_yanked: bool = False,
+    specifier: SpecifierSet | str | None = None,
+) -> PlatformMatches:
+    """Like get_pypi_targets, but without blocking the event loop."""
+    return await asyncio.to_thread(
+        get_pypi_targets, when, package, targets, recheck_yanked, specifier
+    )
+
+
+async def aget_conda(
+    when: datetime.datetime,
+    package: str,
+    conda_command: CondaCommand | None = None,
+    recheck_yanked: bool = False,
+    channels: Sequence[str] | None = None,
+    subdirs: Sequence[str] | None = None,
+    specifier: SpecifierSet | str | None = None,
+) -> MatchesOption:
+    """Like get_conda, but without blocking the event loop.
+
+    With conda_command, this is asearch_conda. Otherwise the lookup runs on
+    the loop's default executor, which bounds how many run at once.
+    """
+    if conda_command is not None:
+        return await asearch_conda(
+            when,
+            package,
+            conda_command,
+            channels,
+            recheck_yanked=recheck_yanked,
+            specifier=specifier,
+        )
+    return await asyncio.to_thread(
+        get_conda,
+        when,
+        package,
+        recheck_yanked=recheck_yanked,
+        channels=channels,
+        subdirs=subdirs,
+        specifier=specifier,
+    )
+
+
+async def aget_conda_platforms(
+    when: datetime.datetime,
+    package: str,
+    platforms: Sequence[str],
+    recheck_yanked: bool = False,
+    channels: Sequence[str] | None = None,
+    specifier: SpecifierSet | str | None = None,
+) -> PlatformMatches:
+    """Like get_conda_platforms, but without blocking the event loop."""
+    return await asyncio.to_thread(
+        get_conda_platforms,
+        when,
+        package,
+        platforms,
+        recheck_yanked,
+        channels,
+        specifier,
+    )
+
+
+async def asearch_conda(
+    when: datetime.datetime,
+    package: str,
+    conda_command: CondaCommand | None,
+    channels: Sequence[str] | None = None,
+    subdir: str | None = None,
+    recheck_yanked: bool = False,
+    specifier: SpecifierSet | str | None = None,
+) -> MatchesOption:
+    """Like search_conda, but running conda as an asyncio subprocess, so many
+    searches can wait on conda at once without tying up a thread each.
+
+    Reading and indexing the results still happens on a thread.
+    """
+    if conda_command is None:
+        return MatchesOption([], no_conda_command)
+    try:
+        # Finding the listing may run conda --version, once per install
+        listing, cmd = await asyncio.to_thread(
+            search_command, package, conda_command, channels, subdir
+        )
+    except RepodataUnavailable as e:
+        return MatchesOption([], str(e))
+    fresh = not recheck_yanked and await asyncio.to_thread(
+        lambda: search_is_fresh(get_local_con(), listing, package, when)
+    )
+    if not fresh:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await proc.communicate()
+        assert proc.returncode is not None
+        try:
+            await asyncio.to_thread(
+                index_search,
+                listing,
+                package,
+                conda_command,
+                proc.returncode,
+                stdout,
+                stderr,
+            )
+        except RepodataUnavailable as e:
+            return MatchesOption([], str(e))
+    return await asyncio.to_thread(search_matches, when, package, listing, specifier)
+
+
+async def aresolve_many(
+    when: datetime.datetime,
+    names: Iterable[CanonicalNames],
+    max_workers: int = default_max_workers,
+    recheck_yanked: bool = False,
+    platforms: Sequence[str] | None = None,
+    targets: Sequence[str] | None = None,
+) -> AsyncIterator[
+    tuple[MatchesOption | PlatformMatches, MatchesOption | PlatformMatches]
+]:
+    """Like resolve_many, but without blocking the event loop.
+
+    At most max_workers lookups run at once, on a pool of their own.
+    """
+    executor = ThreadPoolExecutor(max_workers)
+    try:
+        lookups = submit_lookups(
+            executor, when, names, recheck_yanked, platforms, targets
+        )
+        for pypi_future, conda_future in lookups:
+            yield (
+                await asyncio.wrap_future(pypi_future),
+                await asyncio.wrap_future(conda_future),
+            )
+    finally:
+        # Don't block the loop waiting for lookups nobody wants anymore, as
+        # when the caller stops iterating early
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,138 @@
+import datetime
+import functools
+import warnings
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from packaging.requirements import InvalidRequirement, Requirement
+
+from asof.canonical_names import CanonicalNames
+from asof.conda import get_conda, get_conda_platforms
+from asof.package_match import MatchesOption, PlatformMatches
+from asof.pypi import get_pypi, get_pypi_targets
+
+default_max_workers = 8
+
+
+def resolve_many(
+    when: datetime.datetime,
+    names: Iterable[CanonicalNames],
+    max_workers: int = default_max_workers,
+    recheck_yanked: bool = False,
+    platforms: Sequence[str] | None = None,
+    targets: Sequence[str] | None = None,
+) -> Iterator[tuple[MatchesOption | PlatformMatches, MatchesOption | PlatformMatches]]:
+    """Query PyPI and conda for many packages concurrently.
+
+    Yield a (PyPI, conda) pair of results per package, in input order. If
+    (conda) platforms or (PyPI) targets are given, the corresponding result
+    has an answer for each.
+    """
+    with ThreadPoolExecutor(max_workers) as executor:
+        lookups = submit_lookups(
+            executor, when, names, recheck_yanked, platforms, targets
+        )
+        for pypi_future, conda_future in lookups:
+            yield pypi_future.result(), conda_future.result()
+
+
+def submit_lookups(
+    executor: ThreadPoolExecutor,
+    when: datetime.datetime,
+    names: Iterable[CanonicalNames],
+    recheck_yanked: bool = False,
+    platforms: Sequence[str] | None = None,
+    targets: Sequence[str] | None = None,
+) -> list[
+    tuple[
+        Future[MatchesOption | PlatformMatches],
+        Future[MatchesOption | PlatformMatches],
+    ]
+]:
+    """Submit the PyPI and conda lookups for each package to the executor.
+
+    The two sources are independent, so they run side by side and callers can
+    report whichever finishes first.
+    """
+    pypi_fn: Callable[..., MatchesOption | PlatformMatches]
+    if targets:
+        pypi_fn = functools.partial(
+            get_pypi_targets, targets=targets, recheck_yanked=recheck_yanked
+        )
+    else:
+        pypi_fn = functools.partial(get_pypi, recheck_yanked=recheck_yanked)
+    conda_fn: Callable[..., MatchesOption | PlatformMatches]
+    if platforms:
+        conda_fn = functools.partial(
+            get_conda_platforms, platforms=platforms, recheck_yanked=recheck_yanked
+        )
+    else:
+        conda_fn = functools.partial(get_conda, recheck_yanked=recheck_yanked)
+    return [
+        (
+            submit_or_skip(
+                executor,
+                pypi_fn,
+                when,
+                n.pypi_name,
+                "PyPI",
+            ),
+            submit_or_skip(
+                executor,
+                conda_fn,
+                when,
+                n.conda_name,
+                "conda",
+            ),
+        )
+        for n in names
+    ]
+
+
+def submit_or_skip(
+    executor: ThreadPoolExecutor,
+    fn,
+    when: datetime.datetime,
+    package: str | None,
+    source: str,
+) -> Future:
+    """Submit a lookup, or resolve immediately if there is no name to look up."""
+    if package is None:
+        future: Future[MatchesOption] = Future()
+        future.set_result(MatchesOption([], f"No {source} name to search for"))
+        return future
+    return executor.submit(lookup_or_error, fn, when, package, source)
+
+
+def lookup_or_error(
+    fn,
+    when: datetime.datetime,
+    package: str,
+    source: str,
+) -> MatchesOption | PlatformMatches:
+    """Run a lookup, turning any error into a message for that package alone,
+    so that one bad lookup doesn't cost a batch the rest of its answers.
+    """
+    try:
+        return fn(when, package)
+    except Exception as e:
+        return MatchesOption([], f"Unable to query {source} for {package}: {e!r}")
+
+
+def read_queries(lines: Iterable[str]) -> list[str]:
+    """Extract package names from requirements-file style lines.
+
+    Comments, blank lines, and pip options (-e, --index-url, etc.) are skipped,
+    and version specifiers and markers are dropped, since we only care about
+    the name.
+    """
+    res = []
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        if not line or line.startswith("-"):
+            continue
+        try:
+            res.append(Requirement(line).name)
+        except InvalidRequirement:
+            warnings.warn(f"Unable to parse requirement {line}")
+    return res
@@ -64,6 +64,10 @@ class CanonicalNames(NamedTuple):
     def from_options(
         cls, options: argparse.Namespace, console: Console
     ) -> "CanonicalNames":
-        return getattr(cls, f"from_{options.query_type.lower()}_name")(
-            options.query, console
-        )
+        return cls.from_query(options.query, options.query_type, console)
+
+    @classmethod
+    def from_query(
+        cls, query: str, query_type: str, console: Console
+    ) -> "CanonicalNames":
+        return getattr(cls, f"from_{query_type.lower()}_name")(query, console)
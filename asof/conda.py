@@ -1,35 +1,90 @@
 import datetime
+import hashlib
 import json
-import re
+import os
 import shlex
+import shutil
+import sqlite3
 import subprocess
-import warnings
-from collections import defaultdict
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache, partial
+from pathlib import Path
 from typing import Literal
 
-from packaging.version import VERSION_PATTERN as version_pattern_str
-from packaging.version import Version
-from rich.status import Status
+from packaging.specifiers import SpecifierSet
 
-from asof.package_match import MatchesOption, PackageMatch
-
-version_pattern: re.Pattern = re.compile(
-    version_pattern_str, re.VERBOSE | re.IGNORECASE
+import asof
+from asof.conda_api import conda_api_listing
+from asof.conda_cache import conda_cache_listing
+from asof.db import get_local_con
+from asof.package_match import MatchesOption, PlatformMatches
+from asof.release_index import (
+    ReleaseRecord,
+    iter_releases,
+    replace_releases,
+)
+from asof.repodata import (
+    RepodataUnavailable,
+    conda_version_key,
+    default_subdirs,
+    newest_conda_matches,
+    repodata_listing,
 )
+from asof.selection import select_newest, version_filters
+from asof.shards import shards_listing
+from asof.single_flight import single_flight
+from asof.status import status
 
 CondaCommand = Literal["mamba", "conda"]
 
+no_conda_command = (
+    "Unable to query conda repos as neither conda nor mamba command available"
+)
+
 
+@cache
 def get_conda_command() -> CondaCommand | None:
-    """Guess the user's preferred conda command as mamba, conda, or None."""
-    with Status("Determining conda command"):
-        for command in "mamba", "conda":
-            try:
-                subprocess.run([command], capture_output=True)
-                return command
-            except FileNotFoundError:
-                pass
-        return None
+    """Guess the user's preferred conda command as mamba, conda, or None.
+
+    Only looks at the PATH, so this is cheap and spawns no processes.
+    """
+    for command in "mamba", "conda":
+        if shutil.which(command) is not None:
+            return command
+    return None
+
+
+def conda_command_version(command: CondaCommand, path: str) -> str:
+    """Get the version string (like "conda 24.11.0") of the command's
+    executable at path.
+
+    Running the command is slow, so the answer is cached in the DB, keyed on
+    the executable's path and modification time so that an upgrade is noticed.
+    """
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime_ns = 0
+
+    con = get_local_con()
+    fetched = con.execute(
+        "SELECT version FROM conda_command WHERE path = ? AND mtime_ns = ?",
+        [path, mtime_ns],
+    ).fetchone()
+    if fetched is not None:
+        return fetched[0]
+
+    with status(f"Checking {command} version"):
+        res = subprocess.run([path, "--version"], capture_output=True)
+    # mamba prints its own version, then conda's, on separate lines
+    version = res.stdout.decode().strip().splitlines()[0] if res.stdout else ""
+    with con:
+        con.execute(
+            "INSERT OR REPLACE INTO conda_command VALUES (?, ?, ?, ?)",
+            [command, path, mtime_ns, version],
+        )
+    return version
 
 
 def extract_file_objs(
@@ -75,83 +130,397 @@ def timestamp_to_datetime(
 def get_conda(
     when: datetime.datetime,
     package: str,
-    conda_command: CondaCommand | None = get_conda_command(),
+    conda_command: CondaCommand | None = None,
+    recheck_yanked: bool = False,
+    channels: Sequence[str] | None = None,
+    subdirs: Sequence[str] | None = None,
+    specifier: SpecifierSet | str | None = None,
 ) -> MatchesOption:
-    if conda_command is None:  # still
-        return MatchesOption(
-            [],
-            "Unable to query conda repos as neither conda nor mamba command available",
+    """Get the newest release (and prerelease) of the package as of when.
+
+    By default, read each subdir of each of asof.conda_channels concurrently,
+    trying each of asof.conda_backends in turn so that the channels are read
+    directly when possible and conda search is only a fallback. The channels'
+    releases are merged according to asof.conda_channel_priority. Pass
+    conda_command to use conda search, and with it the user's conda
+    configuration (or the given channels), instead. Pass a specifier (like <2) to only consider the
+    versions it allows.
+    """
+    if conda_command is not None:
+        return search_conda(
+            when,
+            package,
+            conda_command,
+            channels,
+            recheck_yanked=recheck_yanked,
+            specifier=specifier,
         )
 
-    cmd = [
-        conda_command,
-        "search",
-        "--json",
-        package,
+    channels = channels or asof.conda_channels
+    subdirs = subdirs or default_subdirs()
+    try:
+        listings = fetch_listings(when, package, channels, subdirs, recheck_yanked)
+    except RepodataUnavailable as e:
+        return MatchesOption([], str(e))
+    return subdirs_matches(when, package, channels, subdirs, listings, specifier)
+
+
+def get_conda_platforms(
+    when: datetime.datetime,
+    package: str,
+    platforms: Sequence[str],
+    recheck_yanked: bool = False,
+    channels: Sequence[str] | None = None,
+    specifier: SpecifierSet | str | None = None,
+) -> PlatformMatches:
+    """Get the newest release (and prerelease) of the package as of when, for
+    each platform (conda subdir, like linux-64 or osx-arm64).
+
+    Each platform's answer includes noarch packages. The subdirs of all the
+    platforms are fetched and indexed together, so noarch is only read once.
+    """
+    channels = channels or asof.conda_channels
+    platform_subdirs = {
+        p: [p] if p == "noarch" else [p, "noarch"] for p in dict.fromkeys(platforms)
+    }
+    subdirs = list(dict.fromkeys(s for ss in platform_subdirs.values() for s in ss))
+    try:
+        listings = fetch_listings(when, package, channels, subdirs, recheck_yanked)
+    except RepodataUnavailable as e:
+        return PlatformMatches({p: MatchesOption([], str(e)) for p in platform_subdirs})
+    return PlatformMatches(
+        {
+            p: subdirs_matches(when, package, channels, ss, listings, specifier)
+            for p, ss in platform_subdirs.items()
+        }
+    )
+
+
+def subdirs_matches(
+    when: datetime.datetime,
+    package: str,
+    channels: Sequence[str],
+    subdirs: Sequence[str],
+    listings: dict[tuple[str, str], str | None],
+    specifier: SpecifierSet | str | None = None,
+) -> MatchesOption:
+    """Find the newest matches among the given subdirs of the fetched listings."""
+    channel_listings = [
+        [listing for subdir in subdirs if (listing := listings[channel, subdir])]
+        for channel in channels
     ]
+    return newest_conda_matches(
+        when, package, channels, channel_listings, specifier=specifier
+    )
+
+
+def fetch_listings(
+    when: datetime.datetime,
+    package: str,
+    channels: Sequence[str],
+    subdirs: Sequence[str],
+    recheck_yanked: bool = False,
+) -> dict[tuple[str, str], str | None]:
+    """Index the package's records from every channel subdir at once.
+
+    Return the listing of each (channel, subdir), or None for subdirs a
+    channel doesn't have. Raise RepodataUnavailable if any of them can't be
+    read, since an answer that silently skipped a channel could be wrong.
+
+    Concurrent lookups of the package share each channel subdir's fetch.
+    """
+    keys = [(channel, subdir) for channel in channels for subdir in subdirs]
+
+    def fetch(key: tuple[str, str]) -> tuple[tuple[str, str], str | None]:
+        flight = "conda", package, *key, when, recheck_yanked
+        fn = partial(subdir_listing, when, package, *key, recheck_yanked)
+        return key, single_flight(flight, fn)
+
+    if len(keys) == 1:
+        # Stay on this thread, which keeps the status spinner
+        return dict(map(fetch, keys))
+    return dict(listing_executor().map(fetch, keys))
+
+
+@cache
+def listing_executor() -> ThreadPoolExecutor:
+    """Get the pool that channel subdirs are fetched on.
+
+    Shared by all lookups, so that its threads keep their HTTP sessions and
+    DB connections (which are per thread) from one lookup to the next.
+    """
+    return ThreadPoolExecutor(thread_name_prefix="asof-listing")
+
+
+def subdir_listing(
+    when: datetime.datetime,
+    package: str,
+    channel: str,
+    subdir: str,
+    recheck_yanked: bool = False,
+) -> str | None:
+    """Index the package's records from the channel subdir with the first of
+    asof.conda_backends that works, and return the listing.
+    """
+    messages = []
+    for backend in asof.conda_backends:
+        try:
+            match backend:
+                case "conda-cache":
+                    return conda_cache_listing(
+                        when, package, channel, subdir, recheck_yanked
+                    )
+                case "conda-api":
+                    return conda_api_listing(
+                        when, package, channel, subdir, recheck_yanked
+                    )
+                case "shards":
+                    return shards_listing(
+                        when, package, channel, subdir, recheck_yanked
+                    )
+                case "repodata":
+                    return repodata_listing(
+                        when, package, channel, subdir, recheck_yanked
+                    )
+                case "search":
+                    return search_listing(
+                        when,
+                        package,
+                        get_conda_command(),
+                        [channel],
+                        subdir,
+                        recheck_yanked,
+                    )
+                case _:
+                    raise ValueError(f"Unknown conda backend {backend}")
+        except RepodataUnavailable as e:
+            messages.append(str(e))
+    raise RepodataUnavailable("; ".join(messages) or "No conda backends configured")
+
+
+def search_conda(
+    when: datetime.datetime,
+    package: str,
+    conda_command: CondaCommand | None,
+    channels: Sequence[str] | None = None,
+    subdir: str | None = None,
+    recheck_yanked: bool = False,
+    specifier: SpecifierSet | str | None = None,
+) -> MatchesOption:
+    """Query the conda repos using the conda (or mamba) search command.
+
+    Searches the user's configured channels unless channels are given.
+    """
+    try:
+        listing = search_listing(
+            when, package, conda_command, channels, subdir, recheck_yanked
+        )
+    except RepodataUnavailable as e:
+        return MatchesOption([], str(e))
+    return search_matches(when, package, listing, specifier)
+
+
+def search_matches(
+    when: datetime.datetime,
+    package: str,
+    listing: str,
+    specifier: SpecifierSet | str | None = None,
+) -> MatchesOption:
+    """Find the newest matches in the listing of a conda search."""
+    records = iter_releases(get_local_con(), [listing], package, when)
+    if matches := select_newest(package, records, version_filters(specifier)):
+        return MatchesOption(matches, None)
+    else:
+        return MatchesOption(
+            [], f"No matches for {package} available from requested conda channels"
+        )
+
+
+def search_listing(
+    when: datetime.datetime,
+    package: str,
+    conda_command: CondaCommand | None,
+    channels: Sequence[str] | None = None,
+    subdir: str | None = None,
+    recheck_yanked: bool = False,
+) -> str:
+    """Index the package's records as found by conda search and return the
+    listing.
+
+    The parsed output is kept in the release index, so a repeated search
+    within asof.conda_search_lifetime (or any search after the cutoff, unless
+    rechecking yanks) doesn't start a process at all. Raise
+    RepodataUnavailable if the search can't be run or fails.
+    """
+    if conda_command is None:
+        raise RepodataUnavailable(no_conda_command)
+    listing, cmd = search_command(package, conda_command, channels, subdir)
+    if not recheck_yanked and search_is_fresh(get_local_con(), listing, package, when):
+        return listing
+
+    with status(f"Querying conda repo: {shlex.join(cmd)}"):
+        res = subprocess.run(cmd, capture_output=True)
+    index_search(
+        listing, package, conda_command, res.returncode, res.stdout, res.stderr
+    )
+    return listing
+
+
+def search_command(
+    package: str,
+    conda_command: CondaCommand,
+    channels: Sequence[str] | None = None,
+    subdir: str | None = None,
+) -> tuple[str, list[str]]:
+    """Get the listing a conda search for the package fills, and the command
+    line to run it.
+
+    The command is looked up on the PATH each time, so that activating another
+    environment takes effect. Raise RepodataUnavailable if it isn't there.
+    """
+    if (path := shutil.which(conda_command)) is None:
+        raise RepodataUnavailable(f"Unable to find {conda_command} on the PATH")
+
+    args = [conda_command, "search", "--json"]
+    for channel in channels or []:
+        args.extend(["--channel", channel])
+    if channels:
+        args.append("--override-channels")
+    if subdir is not None:
+        args.extend(["--platform", subdir])
+
+    # Different versions of conda may see different channels and format their
+    # output differently, so they count as different listings, as do different
+    # conda configurations
+    version = conda_command_version(conda_command, path)
+    listing = f"{shlex.join(args)} ({version})"
+    if not channels:
+        listing += f" [condarc {conda_config_fingerprint()}]"
+
+    cmd = [path, *args[1:], package]
     if conda_command == "conda":
         # Disable retrying search for "*<package>*"; only conda has this feature
         cmd.append("--skip-flexible-search")
+    return listing, cmd
 
-    with Status(f"Querying conda repo: {shlex.join(cmd)}"):
-        res = subprocess.run(cmd, capture_output=True)
 
-    no_matches_msg = f"No matches for {package} available from requested conda channels"
-    if res.returncode != 0:
-        if "PackagesNotFoundError" in res.stderr.decode():
-            return MatchesOption([], no_matches_msg)
+def index_search(
+    listing: str,
+    package: str,
+    conda_command: CondaCommand,
+    returncode: int,
+    stdout: bytes,
+    stderr: bytes,
+) -> None:
+    """Index the output of a finished conda search into the listing.
 
+    Raise RepodataUnavailable if the search failed.
+    """
+    if returncode != 0:
+        if "PackagesNotFoundError" in stderr.decode():
+            file_objs = []
         else:
             # TODO: Error output is not strictly structured but we may be able
             # to extract additional common cases with regex
-            return MatchesOption(
-                [], f"{conda_command} exited with status {res.returncode}"
+            raise RepodataUnavailable(
+                f"{conda_command} exited with status {returncode}"
             )
+    else:
+        parsed = json.loads(stdout.decode())
+        file_objs = extract_file_objs(conda_command, parsed)
+
+    con = get_local_con()
+    replace_releases(
+        con, listing, package, to_release_records(conda_command, file_objs)
+    )
+    with con:
+        con.execute(
+            "INSERT OR REPLACE INTO conda_search VALUES (?, ?, ?)",
+            [listing, package, datetime.datetime.now(datetime.UTC).isoformat()],
+        )
+
+
+def search_is_fresh(
+    con: sqlite3.Connection,
+    listing: str,
+    package: str,
+    when: datetime.datetime,
+) -> bool:
+    """Check whether we searched for the package recently enough to reuse it.
+
+    A search run after the cutoff already saw every release up to the cutoff,
+    so it stays good for that cutoff no matter how old it is.
+    """
+    fetched = con.execute(
+        "SELECT searched_at FROM conda_search WHERE listing = ? AND package = ?",
+        [listing, package],
+    ).fetchone()
+    if fetched is None:
+        return False
+    searched_at = datetime.datetime.fromisoformat(fetched[0])
+    now = datetime.datetime.now(datetime.UTC)
+    return searched_at > when or now - searched_at < asof.conda_search_lifetime
+
+
+def conda_config_fingerprint() -> str:
+    """Summarize the condarc files conda would read, as a short hash.
+
+    Uses their paths and modification times, so editing the configuration
+    (say, adding a channel) invalidates cached searches.
+    """
+    home = Path.home()
+    xdg_config = Path(os.environ.get("XDG_CONFIG_HOME", home / ".config"))
+    candidates = [
+        Path("/etc/conda/.condarc"),
+        Path("/etc/conda/condarc"),
+        xdg_config / "conda" / ".condarc",
+        xdg_config / "conda" / "condarc",
+        home / ".conda" / ".condarc",
+        home / ".condarc",
+        home / ".mambarc",
+    ]
+    for var in "CONDA_ROOT", "CONDA_PREFIX", "MAMBA_ROOT_PREFIX":
+        if prefix := os.environ.get(var):
+            candidates.append(Path(prefix) / ".condarc")
+    for var in "CONDARC", "MAMBARC":
+        if rc := os.environ.get(var):
+            candidates.append(Path(rc))
+
+    h = hashlib.blake2b(digest_size=8)
+    for path in candidates:
+        try:
+            mtime_ns = path.stat().st_mtime_ns
+        except OSError:
+            continue
+        h.update(f"{path}:{mtime_ns}\n".encode())
+    return h.hexdigest()
 
-    parsed = json.loads(res.stdout.decode())
-    file_objs = extract_file_objs(conda_command, parsed)
 
-    # To avoid having to parse every entry in full, start by grouping by version
-    # string (from the filename)
-    grouped = defaultdict(list)
+def to_release_records(
+    conda_command: CondaCommand,
+    file_objs: list[dict],
+) -> list[tuple[ReleaseRecord, str]]:
+    """Convert conda's file objects to records for the release index."""
+    # Many files share a version string, so only key each one once
+    keys: dict[str, tuple[str, str] | None] = {}
+    res = []
     for file_obj in file_objs:
-        if m := version_pattern.match(file_obj["version"]):
-            version_str = m.group(0)
-            grouped[version_str].append(file_obj)
-        else:
-            warnings.warn(f"Unable to parse version name {file_obj['version']}")
-
-    # Now parse only these keys to Version objects and sort from highest to
-    # lowest. The API JSON tends to put newer versions toward the end, so the
-    # keys are probably *already* almost sorted, so it will be fastest to sort
-    # ascending and then reverse:
-    version_strs = sorted(grouped.keys(), key=Version)
-    version_strs.reverse()
-
-    def get_matches():
-        matches = []
-        for version_str in version_strs:
-            for file_obj in grouped[version_str]:
-                # Ancient results have no timestamp, just assume they are old :)
-                timestamp = file_obj.get("timestamp", 0)
-                dt = timestamp_to_datetime(conda_command, timestamp)
-                if dt > when:
-                    continue
-
-                version_obj = Version(file_obj["version"])
-                if version_obj.is_prerelease and matches:
-                    # If we already have matches, then we already have a
-                    # prerelease higher than this one
-                    continue
-
-                m = PackageMatch(package, version_obj, dt, file_obj["channel"])
-                matches.append(m)
-
-                if not version_obj.is_prerelease:
-                    # Highest non-prerelease match found == done
-                    return matches
-
-    if matches := get_matches():
-        return MatchesOption(matches, None)
-    else:
-        return MatchesOption([], no_matches_msg)
+        version_str = file_obj["version"]
+        if version_str not in keys:
+            keys[version_str] = conda_version_key(version_str)
+        if (keyed := keys[version_str]) is None:
+            continue
+        normalized, key = keyed
+
+        # Ancient results have no timestamp, just assume they are old :)
+        timestamp = file_obj.get("timestamp", 0)
+        record = ReleaseRecord(
+            file_obj.get("fn", ""),
+            normalized,
+            timestamp_to_datetime(conda_command, timestamp),
+            False,
+            file_obj.get("build", ""),
+            file_obj["channel"],
+        )
+        res.append((record, key))
+    return res
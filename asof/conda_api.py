@@ -0,0 +1,110 @@
+import datetime
+import threading
+from collections import defaultdict
+from functools import cache
+from typing import Any
+
+import asof
+from asof.db import get_local_con
+from asof.release_index import replace_releases
+from asof.repodata import (
+    RepodataUnavailable,
+    iter_release_records,
+)
+
+# SubdirData objects hold a channel subdir's parsed repodata, so keep them
+# around (with when they were loaded) to share between queries
+subdir_data: dict[tuple[str, str], tuple[Any, datetime.datetime]] = {}
+# Loading a subdir can mean downloading its repodata, so lock per subdir to let
+# different subdirs load at the same time
+subdir_data_locks: defaultdict[tuple[str, str], threading.Lock] = defaultdict(
+    threading.Lock
+)
+
+
+@cache
+def conda_api() -> tuple[Any, Any] | None:
+    """Import conda's Python API if it is installed (say, when asof lives in a
+    conda base environment).
+
+    Imported lazily because importing conda takes a noticeable fraction of a
+    second, which every other backend would pay for.
+    """
+    try:
+        from conda.api import SubdirData
+        from conda.models.channel import Channel
+    except ImportError:
+        return None
+    return SubdirData, Channel
+
+
+def conda_api_listing(
+    when: datetime.datetime,
+    package: str,
+    channel: str,
+    subdir: str,
+    recheck_yanked: bool = False,
+) -> str:
+    """Index the package's records from the channel subdir, as conda's
+    SubdirData sees them, and return the listing.
+
+    Saves starting a conda process and serializing its output as JSON, and
+    conda's own repodata caching applies. A subdir loaded earlier is reused
+    while it is fresh (see subdir_data_is_fresh). Raise RepodataUnavailable if
+    conda can't be imported.
+    """
+    if (api := conda_api()) is None:
+        raise RepodataUnavailable("conda's Python API isn't importable")
+    SubdirData, Channel = api
+
+    key = channel, subdir
+    with subdir_data_locks[key]:
+        now = datetime.datetime.now(datetime.UTC)
+        if key not in subdir_data:
+            data = SubdirData(Channel(f"{channel}/{subdir}"))
+            subdir_data[key] = data, now
+        else:
+            data, loaded_at = subdir_data[key]
+            if recheck_yanked or not subdir_data_is_fresh(loaded_at, when):
+                data.reload()
+                subdir_data[key] = data, now
+        try:
+            package_records = list(data.query(package))
+        except Exception as e:
+            # conda raises a zoo of its own exception types for network and
+            # channel problems; all mean "try another way"
+            raise RepodataUnavailable(
+                f"{e} when querying {channel}/{subdir} with conda"
+            ) from e
+
+    listing = f"conda-api:{channel}/{subdir}"
+    items = [(r.fn, record_to_dict(r)) for r in package_records]
+    records = iter_release_records(items, channel)
+    replace_releases(get_local_con(), listing, package, [(r, v) for _, r, v in records])
+    return listing
+
+
+def subdir_data_is_fresh(
+    loaded_at: datetime.datetime,
+    when: datetime.datetime,
+) -> bool:
+    """Check whether a subdir loaded at loaded_at can answer for the cutoff.
+
+    Data loaded after the cutoff already has every record up to the cutoff,
+    so it stays good for that cutoff; otherwise it is good for
+    asof.conda_api_lifetime.
+    """
+    now = datetime.datetime.now(datetime.UTC)
+    return loaded_at > when or now - loaded_at < asof.conda_api_lifetime
+
+
+def record_to_dict(record: Any) -> dict:
+    """Convert conda's PackageRecord to the fields we use from repodata."""
+    return {
+        "name": record.name,
+        "version": record.version,
+        "build": record.build,
+        # conda converts timestamps to seconds; repodata_timestamp_to_datetime
+        # copes with either
+        "timestamp": record.timestamp or 0,
+    }
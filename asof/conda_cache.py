@@ -0,0 +1,167 @@
+import datetime
+import json
+import mmap
+import os
+import re
+import shutil
+from collections.abc import Iterator
+from pathlib import Path
+
+from asof.db import get_local_con
+from asof.release_index import replace_releases
+from asof.repodata import (
+    RepodataUnavailable,
+    channel_url,
+    iter_release_records,
+)
+
+# Older conda versions record the source URL inside the cached file itself
+inline_url_pattern: re.Pattern = re.compile(rb'"_url"\s*:\s*"([^"]+)"')
+
+
+def conda_cache_listing(
+    when: datetime.datetime,
+    package: str,
+    channel: str,
+    subdir: str,
+    recheck_yanked: bool = False,
+) -> str:
+    """Index the package's records from the repodata that conda or mamba
+    already cached under pkgs/cache for the channel subdir, and return the
+    listing.
+
+    This is only possible if the subdir was cached (well, last refreshed)
+    after the cutoff; otherwise raise RepodataUnavailable so the next backend
+    can go to the network instead.
+    """
+    if recheck_yanked:
+        raise RepodataUnavailable("Rechecking yanks requires querying the channel")
+    url = f"{channel_url(channel)}/{subdir}"
+    path = find_cache_files().get(url)
+    if path is None:
+        raise RepodataUnavailable(f"No conda cache of {url}")
+    if cache_refreshed_at(path) <= when:
+        raise RepodataUnavailable(f"Conda cache of {url} predates {when}")
+
+    listing = f"{url}/conda-cache"
+    items = scan_cache_file(path, package)
+    records = iter_release_records(items, channel)
+    replace_releases(get_local_con(), listing, package, [(r, v) for _, r, v in records])
+    return listing
+
+
+def pkgs_dirs() -> list[Path]:
+    """Guess where conda and mamba keep their package caches."""
+    candidates: list[Path] = []
+    if env := os.environ.get("CONDA_PKGS_DIRS"):
+        candidates.extend(Path(p) for p in env.split(","))
+    for var in "CONDA_ROOT", "MAMBA_ROOT_PREFIX", "CONDA_PREFIX":
+        if prefix := os.environ.get(var):
+            candidates.append(Path(prefix) / "pkgs")
+    for command in "conda", "mamba":
+        # Executables live in <root>/bin or <root>/condabin
+        if exe := shutil.which(command):
+            candidates.append(Path(exe).resolve().parent.parent / "pkgs")
+    home = Path.home()
+    candidates.append(home / ".conda" / "pkgs")
+    for name in "miniforge3", "miniconda3", "anaconda3", "mambaforge":
+        candidates.append(home / name / "pkgs")
+
+    res: list[Path] = []
+    for p in candidates:
+        if p.is_dir() and p not in res:
+            res.append(p)
+    return res
+
+
+def find_cache_files() -> dict[str, Path]:
+    """Map channel subdir URLs to the newest cached repodata file for each."""
+    res: dict[str, Path] = {}
+    for pkgs_dir in pkgs_dirs():
+        for path in (pkgs_dir / "cache").glob("*.json"):
+            if path.name.endswith((".info.json", ".state.json")):
+                continue
+            if (url := cache_file_url(path)) is None:
+                continue
+            if url not in res or cache_refreshed_at(path) > cache_refreshed_at(
+                res[url]
+            ):
+                res[url] = path
+    return res
+
+
+def cache_file_url(path: Path) -> str | None:
+    """Get the channel subdir URL that a cached repodata file came from."""
+    url = None
+    # Newer conda and mamba keep the URL in a sidecar state file
+    for suffix in ".info.json", ".state.json":
+        state_path = path.with_name(path.stem + suffix)
+        if state_path.exists():
+            try:
+                url = json.loads(state_path.read_text()).get("url")
+            except ValueError:
+                pass
+            break
+    else:
+        with open(path, "rb") as f:
+            if m := inline_url_pattern.search(f.read(4096)):
+                url = m.group(1).decode()
+
+    if not url:
+        return None
+    return url.removesuffix("/").removesuffix("/repodata.json").removesuffix("/")
+
+
+def cache_refreshed_at(path: Path) -> datetime.datetime:
+    """Get the time the cached repodata was last known to be current.
+
+    conda records when it last revalidated the file (which doesn't touch the
+    file itself) as refresh_ns in the sidecar; otherwise go by the mtime.
+    """
+    timestamp = path.stat().st_mtime
+    info_path = path.with_name(path.stem + ".info.json")
+    if info_path.exists():
+        try:
+            refresh_ns = json.loads(info_path.read_text()).get("refresh_ns", 0)
+            timestamp = max(timestamp, refresh_ns / 1e9)
+        except ValueError:
+            pass
+    return datetime.datetime.fromtimestamp(timestamp, datetime.UTC)
+
+
+def scan_cache_file(path: Path, package: str) -> Iterator[tuple[str, dict]]:
+    """Find the package's records in a cached repodata file.
+
+    Rather than parsing the whole file (which can be hundreds of MB), memory
+    map it and search for keys that look like the package's filenames, then
+    decode just the record that follows each one.
+    """
+    key_pattern = re.compile(
+        rb'"(' + re.escape(package.encode()) + rb'-[^"\\/]+)"\s*:\s*\{'
+    )
+    decoder = json.JSONDecoder()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for m in key_pattern.finditer(mm):
+                file_obj = decode_object_at(decoder, mm, m.end() - 1)
+                # Filenames of other packages can share the prefix (foo-bar
+                # for foo), so check the name
+                if file_obj.get("name") == package:
+                    yield m.group(1).decode(), file_obj
+
+
+def decode_object_at(
+    decoder: json.JSONDecoder, mm: mmap.mmap, start: int, size: int = 4096
+) -> dict:
+    """Decode the JSON object starting at start, reading as little as possible."""
+    while True:
+        chunk = mm[start : start + size].decode(errors="replace")
+        try:
+            obj, _ = decoder.raw_decode(chunk)
+            return obj
+        except json.JSONDecodeError:
+            if start + size >= len(mm):
+                raise
+            size *= 4
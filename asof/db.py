@@ -1,14 +1,15 @@
 import datetime
 import json
 import sqlite3
+import threading
 from functools import cache
 
-import requests
 from rich.console import Console
 
 import asof
+from asof import transport
 
-session = requests.Session()
+local = threading.local()
 
 
 @cache
@@ -17,10 +18,7 @@ def get_con(console: Console) -> sqlite3.Connection:
 
     Ensure proper initialization.
     """
-    asof.cache_path.parent.mkdir(parents=True, exist_ok=True)
-    con = sqlite3.connect(str(asof.cache_path))
-
-    initialize_tables(con)
+    con = connect()
     freshly_downloaded = update_downloads(con, console)
     if "name_mapping" in freshly_downloaded:
         asof.db.populate_name_mapping_table(con, console)
@@ -28,6 +26,31 @@ def get_con(console: Console) -> sqlite3.Connection:
     return con
 
 
+def get_local_con() -> sqlite3.Connection:
+    """Get this thread's connection to the SQLite database.
+
+    Unlike get_con, this doesn't refresh the downloads table, so it is cheap
+    and safe to call from the worker threads used for lookups.
+    """
+    if not hasattr(local, "cons"):
+        local.cons = {}
+    # Keyed on path so that changing asof.cache_path (as the tests do) works
+    key = str(asof.cache_path)
+    if key not in local.cons:
+        local.cons[key] = connect()
+    return local.cons[key]
+
+
+def connect() -> sqlite3.Connection:
+    asof.cache_path.parent.mkdir(parents=True, exist_ok=True)
+    # Several threads may write at once in batch mode, so wait on locks rather
+    # than failing immediately
+    con = sqlite3.connect(str(asof.cache_path), timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    initialize_tables(con)
+    return con
+
+
 def initialize_tables(con: sqlite3.Connection):
     with con:
         con.execute(
@@ -36,10 +59,40 @@ def initialize_tables(con: sqlite3.Connection):
         con.execute(
             "CREATE TABLE IF NOT EXISTS name_mapping(conda_name TEXT, import_name TEXT, pypi_name TEXT) STRICT"
         )
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS http_cache(url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, fetched_at TEXT, content BLOB) STRICT"
+        )
         for col in "conda_name import_name pypi_name".split():
             con.execute(
                 f"CREATE INDEX IF NOT EXISTS {col}_index ON name_mapping({col})"
             )
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS release(listing TEXT, package TEXT, filename TEXT, version TEXT, version_key TEXT, upload_time REAL, yanked INTEGER, tags TEXT, source TEXT) STRICT"
+        )
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS listing(listing TEXT PRIMARY KEY, digest TEXT, indexed_at TEXT) STRICT"
+        )
+        con.execute(
+            "CREATE INDEX IF NOT EXISTS release_index ON release(listing, package, version_key DESC)"
+        )
+        con.execute(
+            "CREATE INDEX IF NOT EXISTS release_filename_index ON release(listing, filename)"
+        )
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS shard(sha256 TEXT PRIMARY KEY, content BLOB) STRICT"
+        )
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS conda_command(command TEXT PRIMARY KEY, path TEXT, mtime_ns INTEGER, version TEXT) STRICT"
+        )
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS jlap(listing TEXT PRIMARY KEY, position INTEGER, iv TEXT, have TEXT) STRICT"
+        )
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS tag_set(key TEXT PRIMARY KEY, tags TEXT) STRICT"
+        )
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS conda_search(listing TEXT, package TEXT, searched_at TEXT, PRIMARY KEY (listing, package)) STRICT"
+        )
 
 
 def update_downloads(con: sqlite3.Connection, console: Console) -> list[str]:
@@ -57,7 +110,7 @@ def update_downloads(con: sqlite3.Connection, console: Console) -> list[str]:
             continue
 
         console.print(f"Downloading {request.url}", end="", highlight=True)
-        resp = session.send(request)
+        resp = transport.send(request)
         resp.raise_for_status()
         text_received = resp.content.decode()
         console.print(": [green]OK[/green]", highlight=False)
@@ -0,0 +1,45 @@
+import sys
+from typing import NamedTuple
+
+sdist_suffixes = ".tar.gz", ".zip"
+
+
+class DistFilename(NamedTuple):
+    """The parts of a wheel or sdist filename."""
+
+    name: str
+    # Not yet parsed as a Version, as most files never need it
+    version: str
+    # Wheel build tag, if any
+    build: str
+    # Compressed tag triple (like cp312-cp312-win_amd64); empty for sdists
+    tags: str
+
+
+def parse_filename(filename: str) -> DistFilename | None:
+    """Split a wheel or sdist filename into its parts in a single pass.
+
+    Return None for other formats (eggs, .exe installers, and so on). Simple
+    pages repeat the same versions and tag triples over and over, so those
+    strings are interned. Unlike packaging's parse_wheel_filename and
+    parse_sdist_filename, this doesn't validate the version or tags.
+    """
+    if filename.endswith(".whl"):
+        parts = filename[:-4].split("-")
+        match parts:
+            case [name, version, python, abi, platform]:
+                build = ""
+            case [name, version, build, python, abi, platform]:
+                pass
+            case _:
+                return None
+        tags = sys.intern(f"{python}-{abi}-{platform}")
+        return DistFilename(name, sys.intern(version), build, tags)
+
+    for suffix in sdist_suffixes:
+        if filename.endswith(suffix):
+            name, sep, version = filename[: -len(suffix)].rpartition("-")
+            if not sep or not name or not version:
+                return None
+            return DistFilename(name, sys.intern(version), "", "")
+    return None
@@ -0,0 +1,138 @@
+import datetime
+from collections.abc import Mapping
+from typing import NamedTuple
+
+from asof import transport
+from asof.db import get_local_con
+
+
+class CachedResponse(NamedTuple):
+    """Minimal response object that may have been served from the cache."""
+
+    status_code: int
+    reason: str
+    # None if served from the cache and not read yet; see content
+    body: bytes | None
+    fetched_at: datetime.datetime
+    from_cache: bool
+    url: str
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def content(self) -> bytes:
+        """The body of the response.
+
+        A cached body (which can be hundreds of MB of repodata) is only read
+        from the cache DB when asked for, since callers that already indexed
+        it often just need to know that it is fresh.
+        """
+        if self.body is not None:
+            return self.body
+        fetched = (
+            get_local_con()
+            .execute("SELECT content FROM http_cache WHERE url = ?", [self.url])
+            .fetchone()
+        )
+        if fetched is None:
+            raise LookupError(f"{self.url} is no longer cached")
+        return fetched[0]
+
+
+def conditional_get(
+    url: str,
+    headers: Mapping[str, str],
+    as_of: datetime.datetime | None = None,
+) -> CachedResponse:
+    """GET the URL, revalidating any cached copy with ETag/Last-Modified.
+
+    If the server answers 304 Not Modified, the cached body is returned (with
+    status 200) and only a few headers crossed the wire.
+
+    If as_of is given and the cached copy was fetched after that time, the
+    cached copy is returned without touching the network at all. Callers pass
+    their query cutoff here: a page fetched after the cutoff already lists
+    everything published before it.
+    """
+    con = get_local_con()
+    cached = con.execute(
+        "SELECT etag, last_modified, fetched_at FROM http_cache WHERE url = ?",
+        [url],
+    ).fetchone()
+
+    request_headers = dict(headers)
+    if cached is not None:
+        etag, last_modified, fetched_at = cached
+        fetched_at = datetime.datetime.fromisoformat(fetched_at)
+        if as_of is not None and fetched_at > as_of:
+            return CachedResponse(200, "OK", None, fetched_at, True, url)
+        if etag:
+            request_headers["If-None-Match"] = etag
+        if last_modified:
+            request_headers["If-Modified-Since"] = last_modified
+
+    resp = transport.get(url, headers=request_headers)
+
+    if resp.status_code == 304 and cached is not None:
+        return touch_cached(url)
+
+    now = datetime.datetime.now(datetime.UTC)
+    if resp.ok:
+        # Store even without validators: we can't revalidate such a response,
+        # but it can still answer queries with cutoffs before now
+        with con:
+            con.execute(
+                "INSERT OR REPLACE INTO http_cache VALUES (?, ?, ?, ?, ?)",
+                [
+                    url,
+                    resp.headers.get("ETag"),
+                    resp.headers.get("Last-Modified"),
+                    now.isoformat(),
+                    resp.content,
+                ],
+            )
+
+    return CachedResponse(resp.status_code, resp.reason, resp.content, now, False, url)
+
+
+def get_cached(url: str) -> CachedResponse | None:
+    """Get the cached copy of the URL without touching the network."""
+    fetched = (
+        get_local_con()
+        .execute("SELECT fetched_at FROM http_cache WHERE url = ?", [url])
+        .fetchone()
+    )
+    if fetched is None:
+        return None
+    fetched_at = datetime.datetime.fromisoformat(fetched[0])
+    return CachedResponse(200, "OK", None, fetched_at, True, url)
+
+
+def put_cached(url: str, content: bytes) -> CachedResponse:
+    """Store content we derived ourselves (say, by patching) for the URL.
+
+    There are no validators for such content, so the next conditional_get for
+    the URL will download it in full.
+    """
+    now = datetime.datetime.now(datetime.UTC)
+    con = get_local_con()
+    with con:
+        con.execute(
+            "INSERT OR REPLACE INTO http_cache VALUES (?, NULL, NULL, ?, ?)",
+            [url, now.isoformat(), content],
+        )
+    return CachedResponse(200, "OK", content, now, True, url)
+
+
+def touch_cached(url: str) -> CachedResponse:
+    """Record that the cached copy of the URL was just confirmed current."""
+    now = datetime.datetime.now(datetime.UTC)
+    con = get_local_con()
+    with con:
+        con.execute(
+            "UPDATE http_cache SET fetched_at = ? WHERE url = ?",
+            [now.isoformat(), url],
+        )
+    return CachedResponse(200, "OK", None, now, True, url)
@@ -0,0 +1,143 @@
+import hashlib
+import json
+from typing import Any, NamedTuple
+
+
+class JlapError(Exception):
+    """A jlap file (or the requested chain of patches in it) is unusable."""
+
+
+class Jlap(NamedTuple):
+    """The verified contents of a repodata.jlap file (or the tail of one)."""
+
+    patches: list[dict]
+    # Hash of the newest repodata.json
+    latest: str
+    # Byte offset where the metadata line starts, and the running checksum
+    # up to there. New patches are inserted at this position, so the next
+    # range request starts here.
+    position: int
+    iv: str
+
+
+def parse_jlap(content: bytes, iv: str | None = None, offset: int = 0) -> Jlap:
+    """Parse and verify the lines of a jlap file.
+
+    The format is a first line holding a hex initialization vector, one JSON
+    patch per line, a metadata line naming the latest hash, and a final line
+    holding a checksum: each line is hashed with blake2b keyed on the hash of
+    the line before it. For a range request starting at offset, pass the iv
+    (running checksum) at that offset instead of a first line.
+    """
+    lines = content.split(b"\n")
+    if lines and lines[-1] == b"":
+        lines.pop()
+
+    pos = offset
+    if iv is None:
+        if not lines:
+            raise JlapError("Empty jlap file")
+        first = lines.pop(0)
+        iv = first.decode()
+        pos += len(first) + 1
+    if len(lines) < 2:
+        raise JlapError("Truncated jlap file")
+
+    *body, checksum = lines
+    chain = bytes.fromhex(iv)
+    for line in body:
+        position, metadata_iv = pos, chain
+        chain = hashlib.blake2b(line, key=chain, digest_size=32).digest()
+        pos += len(line) + 1
+    if chain.hex() != checksum.decode():
+        raise JlapError("jlap checksum mismatch")
+
+    metadata = json.loads(body[-1])
+    return Jlap(
+        [json.loads(line) for line in body[:-1]],
+        metadata["latest"],
+        position,
+        metadata_iv.hex(),
+    )
+
+
+def patch_chain(jlap: Jlap, have: str) -> list[dict]:
+    """Get the patches leading from the have hash to the latest one, in order."""
+    by_from = {p["from"]: p for p in jlap.patches}
+    res = []
+    while have != jlap.latest:
+        if have not in by_from:
+            raise JlapError(f"No patch path from {have} to {jlap.latest}")
+        patch = by_from.pop(have)
+        res.append(patch)
+        have = patch["to"]
+    return res
+
+
+def apply_patch(doc: Any, operations: list[dict]) -> Any:
+    """Apply a JSON patch (RFC 6902) to the document in place.
+
+    Return the document, which is only a different object if the patch
+    replaced the root.
+    """
+    for op in operations:
+        path = parse_pointer(op["path"])
+        match op["op"]:
+            case "add":
+                doc = add(doc, path, op["value"])
+            case "remove":
+                remove(doc, path)
+            case "replace":
+                if path:
+                    remove(doc, path)
+                doc = add(doc, path, op["value"])
+            case "move":
+                value = get(doc, parse_pointer(op["from"]))
+                remove(doc, parse_pointer(op["from"]))
+                doc = add(doc, path, value)
+            case "copy":
+                value = get(doc, parse_pointer(op["from"]))
+                doc = add(doc, path, json.loads(json.dumps(value)))
+            case "test":
+                if get(doc, path) != op["value"]:
+                    raise JlapError(f"Patch test failed at {op['path']}")
+            case _:
+                raise JlapError(f"Unknown patch operation {op['op']}")
+    return doc
+
+
+def parse_pointer(pointer: str) -> list[str]:
+    """Split a JSON pointer (RFC 6901) into unescaped reference tokens."""
+    if pointer == "":
+        return []
+    return [t.replace("~1", "/").replace("~0", "~") for t in pointer.split("/")[1:]]
+
+
+def get(doc: Any, path: list[str]) -> Any:
+    for token in path:
+        doc = doc[int(token)] if isinstance(doc, list) else doc[token]
+    return doc
+
+
+def add(doc: Any, path: list[str], value: Any) -> Any:
+    if not path:
+        return value
+    parent = get(doc, path[:-1])
+    token = path[-1]
+    if isinstance(parent, list):
+        if token == "-":
+            parent.append(value)
+        else:
+            parent.insert(int(token), value)
+    else:
+        parent[token] = value
+    return doc
+
+
+def remove(doc: Any, path: list[str]):
+    parent = get(doc, path[:-1])
+    token = path[-1]
+    if isinstance(parent, list):
+        del parent[int(token)]
+    else:
+        del parent[token]
@@ -0,0 +1,191 @@
+import datetime
+import statistics
+import threading
+import time
+from collections import deque
+from collections.abc import Mapping, Sequence
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+import requests
+
+import asof
+from asof.http_cache import CachedResponse, conditional_get
+
+# Hedged requests run here, so that the caller can wait on several at once
+hedge_executor = ThreadPoolExecutor(thread_name_prefix="asof-hedge")
+# Response times to keep per mirror for the hedging delay
+latency_window = 100
+
+
+class MirrorHealth:
+    """Recent response times and failures of one mirror.
+
+    Acts as a circuit breaker: after asof.mirror_failure_limit failures in a
+    row, the mirror is skipped for asof.mirror_cooldown seconds, and then
+    gets one request to prove itself again.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.latencies: deque[float] = deque(maxlen=latency_window)
+        self.failures = 0
+        self.open_until = 0.0
+
+    def available(self) -> bool:
+        with self.lock:
+            if self.failures < asof.mirror_failure_limit:
+                return True
+            if time.monotonic() < self.open_until:
+                return False
+            # Half open: let this request through, but hold off others until
+            # it succeeds
+            self.open_until = time.monotonic() + asof.mirror_cooldown
+            return True
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait for a response before also asking the next mirror.
+
+        The 95th percentile of recent response times, so that only the slowest
+        few requests get hedged.
+        """
+        with self.lock:
+            if len(self.latencies) < 20:
+                return asof.pypi_hedge_delay
+            return statistics.quantiles(self.latencies, n=20)[-1]
+
+    def record(self, ok: bool, elapsed: float | None) -> None:
+        with self.lock:
+            if ok:
+                self.failures = 0
+                if elapsed is not None:
+                    self.latencies.append(elapsed)
+            else:
+                self.failures += 1
+                if self.failures >= asof.mirror_failure_limit:
+                    self.open_until = time.monotonic() + asof.mirror_cooldown
+
+
+health: dict[str, MirrorHealth] = {}
+health_lock = threading.Lock()
+
+
+def mirror_health(baseurl: str) -> MirrorHealth:
+    with health_lock:
+        if baseurl not in health:
+            health[baseurl] = MirrorHealth()
+        return health[baseurl]
+
+
+def is_good(resp: CachedResponse) -> bool:
+    """Check whether a response answers the question, as opposed to a server
+    problem that another mirror might not have."""
+    # A 404 is an answer: the package doesn't exist
+    return resp.ok or resp.status_code == 404
+
+
+def mirror_get(
+    baseurl: str,
+    path: str,
+    headers: Mapping[str, str],
+    as_of: datetime.datetime | None,
+    started: Future[float] | None = None,
+) -> CachedResponse:
+    """conditional_get the path from the mirror, keeping track of its health.
+
+    If given, started is resolved to the start time once the request leaves
+    the executor queue.
+    """
+    start = time.monotonic()
+    if started is not None:
+        started.set_result(start)
+    try:
+        resp = conditional_get(f"{baseurl}{path}", headers, as_of=as_of)
+    except requests.RequestException:
+        mirror_health(baseurl).record(False, None)
+        raise
+    # Answers from the cache say nothing about the mirror's response times
+    elapsed = None if resp.from_cache else time.monotonic() - start
+    mirror_health(baseurl).record(is_good(resp), elapsed)
+    return resp
+
+
+def hedged_get(
+    baseurls: Sequence[str],
+    path: str,
+    headers: Mapping[str, str],
+    as_of: datetime.datetime | None = None,
+) -> CachedResponse:
+    """GET the path from the first of several mirrors to answer well.
+
+    Mirrors are asked in order. If one hasn't answered within its hedging
+    delay, the next one is asked too, without cancelling the first; if one
+    fails, the next one is asked right away. The delay only runs once a
+    request has actually started, so time spent waiting for a free
+    hedge_executor thread doesn't trigger hedges. Mirrors whose circuit
+    breaker is open are skipped, unless all of them are. If none answers well, return the
+    last response, or raise the last error if there wasn't any.
+    """
+    if len(baseurls) == 1:
+        return mirror_get(baseurls[0], path, headers, as_of)
+
+    remaining = list(baseurls)
+    pending: dict[Future[CachedResponse], str] = {}
+    asked: list[str] = []
+
+    def ask_next() -> tuple[str, Future[float]] | None:
+        # Check the breakers only when needed, as a half-open breaker lets
+        # just one request through
+        while remaining:
+            baseurl = remaining.pop(0)
+            if mirror_health(baseurl).available():
+                break
+        else:
+            if asked:
+                return None
+            baseurl = baseurls[0]
+        started: Future[float] = Future()
+        future = hedge_executor.submit(
+            mirror_get, baseurl, path, headers, as_of, started
+        )
+        pending[future] = baseurl
+        asked.append(baseurl)
+        return baseurl, started
+
+    latest = ask_next()
+    last_resp: CachedResponse | None = None
+    last_error: requests.RequestException | None = None
+    while pending:
+        waiting: set[Future] = set(pending)
+        timeout = None
+        if latest is not None:
+            baseurl, started = latest
+            if started.done():
+                elapsed = time.monotonic() - started.result()
+                timeout = max(0.0, mirror_health(baseurl).hedge_delay() - elapsed)
+            else:
+                # Still queued; wake up when it starts to arm the timer
+                waiting.add(started)
+        done, _ = wait(waiting, timeout, return_when=FIRST_COMPLETED)
+        done &= set(pending)
+        if not done:
+            if timeout is not None:
+                latest = ask_next()
+            continue
+        for future in done:
+            del pending[future]
+            try:
+                resp = future.result()
+            except requests.RequestException as e:
+                last_error = e
+                continue
+            if is_good(resp):
+                return resp
+            last_resp = resp
+        if not pending:
+            # Everyone asked so far failed; fail over
+            latest = ask_next()
+
+    if last_resp is not None:
+        return last_resp
+    assert last_error is not None
+    raise last_error
@@ -30,3 +30,14 @@ class MatchesOption(NamedTuple):
             console.print(f"[gray]{self.message}[/gray]", highlight=False)
         for m in self.matches:
             console.print(m.pretty, highlight=False)
+
+
+class PlatformMatches(NamedTuple):
+    """Package matches (or status message) for each of several platforms."""
+
+    by_platform: dict[str, MatchesOption]
+
+    def log(self, console: Console) -> None:
+        for platform, option in self.by_platform.items():
+            console.print(f"[italic]{platform}:[/italic]", highlight=False)
+            option.log(console)
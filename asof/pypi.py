@@ -1,120 +1,213 @@
 import datetime
+import hashlib
 import json
-import re
+import sqlite3
 import warnings
-from collections import defaultdict
-
-import requests
-from packaging.tags import sys_tags
-from packaging.utils import (
-    InvalidSdistFilename,
-    InvalidWheelFilename,
-    parse_sdist_filename,
-    parse_wheel_filename,
-)
-from packaging.version import VERSION_PATTERN as version_pattern_str
-from packaging.version import Version
-from rich.status import Status
+from collections.abc import Sequence
+from functools import partial
 
-import asof
-from asof.package_match import MatchesOption, PackageMatch
+from packaging.specifiers import SpecifierSet
+from packaging.utils import canonicalize_name
+from packaging.version import InvalidVersion
 
-version_pattern: re.Pattern = re.compile(
-    version_pattern_str, re.VERBOSE | re.IGNORECASE
+import asof
+from asof.db import get_local_con
+from asof.filenames import parse_filename, sdist_suffixes
+from asof.mirrors import hedged_get
+from asof.package_match import MatchesOption, PlatformMatches
+from asof.release_index import (
+    ReleaseRecord,
+    iter_releases,
+    listing_digest,
+    replace_releases,
+    set_listing_digest,
+    sort_key,
 )
-
-
-def get_pypi(when: datetime.datetime, package: str) -> MatchesOption:
-    url = f"{asof.pypi_baseurl}/simple/{package}/"
-    with Status(f"Querying PyPI at {url}"):
-        resp = requests.get(
-            url,
+from asof.selection import (
+    RecordFilter,
+    select_newest,
+    select_newest_by_mask,
+    version_filters,
+)
+from asof.single_flight import single_flight
+from asof.status import status
+from asof.tags import TagBitsets, host_bitsets, target_bitsets
+
+
+def get_pypi(
+    when: datetime.datetime,
+    package: str,
+    recheck_yanked: bool = False,
+    specifier: SpecifierSet | str | None = None,
+) -> MatchesOption:
+    """Get the newest release (and prerelease) of the package as of when.
+
+    A cached page fetched after the cutoff already lists every file uploaded
+    before it, so it is used without any network I/O. The only thing that can
+    change the answer afterward is a file getting yanked; pass recheck_yanked
+    to revalidate the page anyway. Pass a specifier (like <2) to only consider
+    the versions it allows.
+    """
+    name = canonicalize_name(package)
+    if (error := fetch_page(when, name, recheck_yanked)) is not None:
+        return MatchesOption([], page_error(package, error))
+
+    filters: list[RecordFilter] = [
+        partial(target_compatible, host_bitsets(), 1),
+        *version_filters(specifier),
+    ]
+    records = iter_releases(get_local_con(), [asof.pypi_baseurl], name, when)
+    if matches := select_newest(package, records, filters):
+        return MatchesOption(matches, None)
+    else:
+        return no_matches(when, package)
+
+
+def get_pypi_targets(
+    when: datetime.datetime,
+    package: str,
+    targets: Sequence[str],
+    recheck_yanked: bool = False,
+    specifier: SpecifierSet | str | None = None,
+) -> PlatformMatches:
+    """Get the newest release (and prerelease) of the package as of when, for
+    each target environment (like cp311-manylinux_2_28_x86_64; see
+    parse_target) rather than for this interpreter.
+
+    The page is fetched once for all targets and the release index walked
+    once, checking each file against all of them with a single bitmask.
+    """
+    name = canonicalize_name(package)
+    if (error := fetch_page(when, name, recheck_yanked)) is not None:
+        message = page_error(package, error)
+        return PlatformMatches({t: MatchesOption([], message) for t in targets})
+
+    bitsets = target_bitsets(tuple(dict.fromkeys(targets)))
+    records = iter_releases(get_local_con(), [asof.pypi_baseurl], name, when)
+    per_target = select_newest_by_mask(
+        package,
+        records,
+        len(bitsets.targets),
+        partial(target_mask, bitsets),
+        version_filters(specifier),
+    )
+    return PlatformMatches(
+        {
+            target.name: MatchesOption(matches, None)
+            if matches
+            else no_matches(when, package)
+            for target, matches in zip(bitsets.targets, per_target)
+        }
+    )
+
+
+def fetch_page(
+    when: datetime.datetime,
+    package: str,
+    recheck_yanked: bool = False,
+) -> str | None:
+    """Make sure the package's simple index page is fetched and indexed.
+
+    Return the error status (like "404: Not Found") if it can't be; see
+    page_error. Concurrent lookups of the package share one fetch; pass the
+    normalized name (see canonicalize_name) so that different spellings of it
+    do too.
+    """
+    flight = "pypi", asof.pypi_baseurl, package, when, recheck_yanked
+    return single_flight(
+        flight, partial(fetch_and_index_page, when, package, recheck_yanked)
+    )
+
+
+def fetch_and_index_page(
+    when: datetime.datetime,
+    package: str,
+    recheck_yanked: bool = False,
+) -> str | None:
+    path = f"/simple/{package}/"
+    with status(f"Querying PyPI at {asof.pypi_baseurl}{path}"):
+        # Mirrors serve the same page, so whichever answers, it is indexed
+        # under pypi_baseurl
+        resp = hedged_get(
+            [asof.pypi_baseurl, *asof.pypi_mirrors],
+            path,
             headers={"Accept": "application/vnd.pypi.simple.v1+json"},
+            as_of=None if recheck_yanked else when,
         )
     if not resp.ok:
-        return MatchesOption(
-            [],
-            f"{resp.status_code}: {resp.reason} when attempting to get query PyPI at {url}",
-        )
+        return f"{resp.status_code}: {resp.reason}"
+
+    # Each mirror's copy is cached separately, but all of them are indexed
+    # under pypi_baseurl, so track which body the index was built from: a
+    # fresh copy from one can follow a stale one from another
+    con = get_local_con()
+    page = f"{asof.pypi_baseurl}{path}"
+    digest = hashlib.blake2b(resp.content, digest_size=32).hexdigest()
+    if listing_digest(con, page) != digest:
+        index_page(con, package, resp.content)
+        set_listing_digest(con, page, digest)
+    return None
 
-    json_data = resp.content.decode()
-    file_objs = json.loads(json_data)["files"]
 
-    # To avoid having to parse every entry in full, start by grouping by version
-    # string (from the filename)
-    grouped = defaultdict(list)
+def page_error(package: str, error: str) -> str:
+    """Describe a failed fetch of the package's page, by the name as given."""
+    url = f"{asof.pypi_baseurl}/simple/{package}/"
+    return f"{error} when attempting to get query PyPI at {url}"
+
+
+def no_matches(when: datetime.datetime, package: str) -> MatchesOption:
+    return MatchesOption(
+        [],
+        f"No compatible releases or prereleases on PyPI as of {when.isoformat()} for package {package}",
+    )
+
+
+def index_page(con: sqlite3.Connection, package: str, content: bytes):
+    """Parse a simple index page and store its files in the release index."""
+    file_objs = json.loads(content.decode())["files"]
+
+    # Many files share a version string, so only key each one once
+    keys: dict[str, str | None] = {}
+    records = []
     for file_obj in file_objs:
-        if m := version_pattern.search(file_obj["filename"]):
-            version_str = m.group(0)
-            grouped[version_str].append(file_obj)
-        else:
-            warnings.warn(f"Unable to parse version name {file_obj['filename']}")
-
-    # Now parse only these keys to Version objects and sort from highest to
-    # lowest. The API JSON tends to put newer versions toward the end, so the
-    # keys are probably *already* almost sorted, so it will be fastest to sort
-    # ascending and then reverse:
-    version_strs = sorted(grouped.keys(), key=Version)
-    version_strs.reverse()
-
-    # Walk backwards through versions and return newest release version and
-    # newest prerelease (if available)
-    def get_matches():
-        matches = []
-        for version_str in version_strs:
-            for file_obj in grouped[version_str]:
-                if file_obj["yanked"]:
-                    continue
-
-                dt = datetime.datetime.fromisoformat(file_obj["upload-time"])
-                if dt > when:
-                    continue
-
-                version_obj = is_compatible(file_obj)
-                if version_obj is None:
-                    continue
-                if version_obj.is_prerelease and matches:
-                    # If we already have matches, then we already have a
-                    # prerelease higher than this one
-                    continue
-
-                m = PackageMatch(package, version_obj, dt, asof.pypi_baseurl)
-                matches.append(m)
-
-                if not version_obj.is_prerelease:
-                    # Highest non-prerelease match found == done
-                    return matches
-
-    if matches := get_matches():
-        return MatchesOption(matches, None)
-    else:
-        return MatchesOption(
-            [],
-            f"No compatible releases or prereleases on PyPI as of {when.isoformat()} for package {package}",
+        filename = file_obj["filename"]
+        if (parsed := parse_filename(filename)) is None:
+            # Could be an ancient .exe or other obsolete packaging format
+            continue
+
+        if parsed.version not in keys:
+            try:
+                keys[parsed.version] = sort_key(parsed.version)
+            except InvalidVersion:
+                warnings.warn(f"Unable to parse version name {filename}")
+                keys[parsed.version] = None
+        if (key := keys[parsed.version]) is None:
+            continue
+
+        record = ReleaseRecord(
+            filename,
+            parsed.version,
+            datetime.datetime.fromisoformat(file_obj["upload-time"]),
+            bool(file_obj["yanked"]),
+            parsed.tags,
+            asof.pypi_baseurl,
         )
+        records.append((record, key))
 
+    replace_releases(con, asof.pypi_baseurl, package, records)
 
-def is_compatible(file_obj: dict) -> Version | None:
-    """Inspect the PyPI filename and determine compatibility with my system.
 
-    Return the version if so.
-    """
-    filename = file_obj["filename"]
-    try:
+def target_mask(bitsets: TagBitsets, record: ReleaseRecord) -> int:
+    """Get the targets that the file is compatible with, as a bitmask."""
+    if record.filename.endswith(".whl"):
+        return bitsets.mask(record.tags)
+    if record.filename.endswith(sdist_suffixes):
         # sdist filename doesn't contain any compat info, so just assume so
-        _, version = parse_sdist_filename(filename)
-        return version
-    except InvalidSdistFilename:
-        pass
-
-    try:
-        _, version, _, tags = parse_wheel_filename(filename)
-        for t in sys_tags():
-            if t in tags:
-                return version
-        return None
-    except InvalidWheelFilename:
-        pass
-
+        return bitsets.all
     # Could be an ancient .exe or other obsolete packaging format
-    return None
+    return 0
+
+
+def target_compatible(bitsets: TagBitsets, bit: int, record: ReleaseRecord) -> bool:
+    """Check whether the file is compatible with the target bit."""
+    return bool(target_mask(bitsets, record) & bit)
@@ -0,0 +1,299 @@
+import datetime
+import heapq
+import sqlite3
+from collections.abc import Iterable, Iterator, Sequence
+from functools import cache
+from typing import NamedTuple
+
+from packaging.version import Version
+
+
+class ReleaseRecord(NamedTuple):
+    """One released file, as stored in the release index."""
+
+    filename: str
+    version: str
+    upload_time: datetime.datetime
+    yanked: bool
+    # Compressed wheel tags for PyPI files (python-abi-platform), build string
+    # for conda files
+    tags: str
+    # Where the file was published (PyPI base URL or conda channel)
+    source: str
+
+
+def version_key(version: Version) -> str:
+    """Encode a version as a string that sorts the same way the version does.
+
+    This lets SQLite do the ORDER BY instead of parsing and sorting every
+    version in Python. Follows the comparison key used by packaging: numbers
+    are length-prefixed so they compare numerically, and each field is
+    prefix-free so that no field bleeds into the next.
+    """
+    parts = [num_key(version.epoch), release_key(version.release)]
+
+    # 0 < 1 < 2 stand in for -infinity, a value, and +infinity
+    if version.pre is None and version.post is None and version.dev is not None:
+        # 1.0.dev0 sorts before 1.0a0
+        parts.append("0")
+    elif version.pre is None:
+        parts.append("2")
+    else:
+        letter, n = version.pre
+        parts.append(f"1{letter}{num_key(n)}")
+
+    parts.append("0" if version.post is None else f"1{num_key(version.post)}")
+    parts.append("2" if version.dev is None else f"1{num_key(version.dev)}")
+
+    # Local segments: numeric segments sort above alphanumeric ones
+    if version.local is None:
+        parts.append("0")
+    else:
+        segments = (
+            f"1{num_key(int(s))}" if s.isdigit() else f"0{s}"
+            for s in version.local.split(".")
+        )
+        parts.append("1" + ".".join(segments))
+
+    return "".join(parts)
+
+
+def plain_version_key(version_str: str) -> str | None:
+    """Get the version_key of a plain release number (like 1.2.3), or a dev
+    release of one (like 1.2.3.dev20240101, as nightlies use), straight from
+    the string, without constructing a Version.
+
+    Most versions look like this, so the full parse is only needed for the
+    rest (pre- and post-releases, epochs, local versions, and strings that
+    aren't in normal form); return None for those.
+    """
+    release_str, sep, dev = version_str.partition(".dev")
+    if sep and not is_normal_number(dev):
+        return None
+    release = []
+    for part in release_str.split("."):
+        if not is_normal_number(part):
+            return None
+        release.append(int(part))
+
+    # Epoch 0 and no pre-release, post-release, or local segment
+    if sep:
+        # Dev releases sort before pre-releases
+        return (
+            num_key(0)
+            + release_key(release)
+            + "0"
+            + "0"
+            + f"1{num_key(int(dev))}"
+            + "0"
+        )
+    return num_key(0) + release_key(release) + "2" + "0" + "2" + "0"
+
+
+def is_normal_number(s: str) -> bool:
+    """Check that s is a number written the way str(int(s)) would write it."""
+    return s.isascii() and s.isdigit() and (s == "0" or not s.startswith("0"))
+
+
+def release_key(release: Iterable[int]) -> str:
+    # Trailing zeros don't count (1.0 == 1.0.0); the space terminator sorts
+    # below the "." separator, so 1.2 < 1.2.1
+    release = list(release)
+    while len(release) > 1 and release[-1] == 0:
+        release.pop()
+    return ".".join(num_key(n) for n in release) + " "
+
+
+def sort_key(version_str: str) -> str:
+    """Get the version_key of a PEP 440 version string, parsing it only if
+    needed. Raise InvalidVersion if it isn't one.
+    """
+    if (res := plain_version_key(version_str)) is not None:
+        return res
+    return version_key(Version(version_str))
+
+
+@cache
+def parse_version(version_str: str) -> Version:
+    """Parse a version string, remembering the result.
+
+    Used while walking the release index, which only ever reaches the top few
+    versions, so only those get parsed.
+    """
+    return Version(version_str)
+
+
+def num_key(n: int) -> str:
+    """Length-prefix a number so that string order matches numeric order."""
+    digits = str(n)
+    return f"{len(digits):02d}{digits}"
+
+
+def replace_releases(
+    con: sqlite3.Connection,
+    listing: str,
+    package: str,
+    records: Iterable[tuple[ReleaseRecord, str]],
+):
+    """Replace everything indexed for the package with the given records.
+
+    Records come paired with the sort key of their version (see version_key
+    and sort_key). The listing identifies where the records came from (say, a
+    PyPI simple index), since the same package name can appear in several.
+    """
+    values = [
+        (
+            listing,
+            package,
+            r.filename,
+            r.version,
+            key,
+            r.upload_time.timestamp(),
+            int(r.yanked),
+            r.tags,
+            r.source,
+        )
+        for r, key in records
+    ]
+    with con:
+        con.execute(
+            "DELETE FROM release WHERE listing = ? AND package = ?", [listing, package]
+        )
+        con.executemany(
+            "INSERT INTO release VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", values
+        )
+
+
+def listing_digest(con: sqlite3.Connection, listing: str) -> str | None:
+    """Get the digest of the content the listing was last indexed from."""
+    fetched = con.execute(
+        "SELECT digest FROM listing WHERE listing = ?", [listing]
+    ).fetchone()
+    return None if fetched is None else fetched[0]
+
+
+def set_listing_digest(con: sqlite3.Connection, listing: str, digest: str):
+    """Record the digest of the content the listing was just indexed from."""
+    with con:
+        con.execute(
+            "INSERT OR REPLACE INTO listing VALUES (?, ?, ?)",
+            [listing, digest, datetime.datetime.now(datetime.UTC).isoformat()],
+        )
+
+
+def replace_listing(
+    con: sqlite3.Connection,
+    listing: str,
+    digest: str,
+    records: Iterable[tuple[str, ReleaseRecord, str]],
+):
+    """Replace everything indexed for the listing, for all packages at once.
+
+    Records are (package, record, sort key) triples and may be a generator, so
+    a large listing can be streamed in without holding it all in memory. The
+    digest of the content is stored so that unchanged content isn't indexed
+    twice.
+    """
+    values = (
+        (
+            listing,
+            package,
+            r.filename,
+            r.version,
+            key,
+            r.upload_time.timestamp(),
+            int(r.yanked),
+            r.tags,
+            r.source,
+        )
+        for package, r, key in records
+    )
+    with con:
+        con.execute("DELETE FROM release WHERE listing = ?", [listing])
+        con.executemany(
+            "INSERT INTO release VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", values
+        )
+        con.execute(
+            "INSERT OR REPLACE INTO listing VALUES (?, ?, ?)",
+            [listing, digest, datetime.datetime.now(datetime.UTC).isoformat()],
+        )
+
+
+def update_listing(
+    con: sqlite3.Connection,
+    listing: str,
+    digest: str,
+    filenames: Iterable[str],
+    records: Iterable[tuple[str, ReleaseRecord, str]],
+):
+    """Replace just the given files of the listing.
+
+    Files in filenames are dropped, then records (which may re-add some of
+    them) are inserted. Used to apply incremental updates without indexing
+    the listing all over again.
+    """
+    values = [
+        (
+            listing,
+            package,
+            r.filename,
+            r.version,
+            key,
+            r.upload_time.timestamp(),
+            int(r.yanked),
+            r.tags,
+            r.source,
+        )
+        for package, r, key in records
+    ]
+    with con:
+        con.executemany(
+            "DELETE FROM release WHERE listing = ? AND filename = ?",
+            [(listing, f) for f in filenames],
+        )
+        con.executemany(
+            "INSERT INTO release VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", values
+        )
+        con.execute(
+            "INSERT OR REPLACE INTO listing VALUES (?, ?, ?)",
+            [listing, digest, datetime.datetime.now(datetime.UTC).isoformat()],
+        )
+
+
+# Ties keep the order of the original listing
+releases_query = (
+    "SELECT version_key, filename, version, upload_time, yanked, tags, source "
+    "FROM release WHERE listing = ? AND package = ? AND upload_time <= ? "
+    "AND NOT yanked ORDER BY version_key DESC, rowid"
+)
+
+
+def iter_releases(
+    con: sqlite3.Connection,
+    listings: Sequence[str],
+    package: str,
+    when: datetime.datetime,
+) -> Iterator[ReleaseRecord]:
+    """Iterate over unyanked files published by when, newest version first.
+
+    Files from all of the given listings are merged. Among files of the same
+    version, those from earlier listings come first. Each listing gets its own
+    cursor, which walks release_index in order without sorting, and the
+    cursors are merged in Python; so rows are pulled lazily, and a caller that
+    stops after the first few versions never reads the rest.
+    """
+    cursors = [
+        con.execute(releases_query, [listing, package, when.timestamp()])
+        for listing in listings
+    ]
+    # merge is stable, so ties keep the order of the listings
+    rows = heapq.merge(*cursors, key=lambda row: row[0], reverse=True)
+    for _, filename, version, upload_time, yanked, tags, source in rows:
+        yield ReleaseRecord(
+            filename,
+            version,
+            datetime.datetime.fromtimestamp(upload_time, datetime.UTC),
+            bool(yanked),
+            tags,
+            source,
+        )
@@ -0,0 +1,456 @@
+import datetime
+import hashlib
+import itertools
+import json
+import platform
+import re
+import sqlite3
+import sys
+import threading
+import warnings
+from collections import defaultdict
+from collections.abc import Iterable, Iterator, Sequence
+from typing import Literal
+
+import requests
+from packaging.specifiers import SpecifierSet
+from packaging.version import VERSION_PATTERN as version_pattern_str
+from packaging.version import InvalidVersion, Version
+
+import asof
+from asof import transport
+from asof.db import get_local_con
+from asof.http_cache import (
+    CachedResponse,
+    conditional_get,
+    get_cached,
+    put_cached,
+    touch_cached,
+)
+from asof.jlap import (
+    Jlap,
+    JlapError,
+    apply_patch,
+    parse_jlap,
+    parse_pointer,
+    patch_chain,
+)
+from asof.package_match import MatchesOption
+from asof.release_index import (
+    ReleaseRecord,
+    iter_releases,
+    listing_digest,
+    plain_version_key,
+    replace_listing,
+    update_listing,
+    version_key,
+)
+from asof.selection import select_newest, version_filters
+from asof.status import status
+
+version_pattern: re.Pattern = re.compile(
+    version_pattern_str, re.VERBOSE | re.IGNORECASE
+)
+
+# (sys.platform, platform.machine()) -> conda subdir
+host_subdirs = {
+    ("linux", "x86_64"): "linux-64",
+    ("linux", "aarch64"): "linux-aarch64",
+    ("linux", "ppc64le"): "linux-ppc64le",
+    ("linux", "s390x"): "linux-s390x",
+    ("darwin", "x86_64"): "osx-64",
+    ("darwin", "arm64"): "osx-arm64",
+    ("win32", "amd64"): "win-64",
+    ("win32", "arm64"): "win-arm64",
+}
+
+
+ChannelPriority = Literal["strict", "flexible"]
+
+# Only one thread should fetch or index a given listing at a time. Reentrant
+# since repodata_listing holds it across sync_jlap and index_repodata
+ingest_locks: defaultdict[str, threading.RLock] = defaultdict(threading.RLock)
+
+
+class RepodataUnavailable(Exception):
+    """A channel's repodata couldn't be fetched."""
+
+
+def host_subdir() -> str | None:
+    """Get the conda subdir (like linux-64) of this machine, if known."""
+    return host_subdirs.get((sys.platform, platform.machine().lower()))
+
+
+def channel_url(channel: str) -> str:
+    """Get the URL of a channel given as a name (conda-forge) or URL."""
+    if "://" in channel:
+        return channel.rstrip("/")
+    return f"{asof.conda_channel_baseurl}/{channel}"
+
+
+def fetch_repodata(
+    channel: str,
+    subdir: str,
+    as_of: datetime.datetime | None,
+) -> CachedResponse | None:
+    """Fetch (or revalidate) repodata.json for a channel subdir.
+
+    Return None if the channel doesn't have this subdir.
+    """
+    url = f"{channel_url(channel)}/{subdir}/repodata.json"
+    try:
+        with status(f"Fetching {url}"):
+            resp = conditional_get(url, {"Accept": "application/json"}, as_of=as_of)
+    except requests.RequestException as e:
+        raise RepodataUnavailable(f"{e} when attempting to fetch {url}") from e
+
+    if resp.status_code == 404:
+        return None
+    if not resp.ok:
+        raise RepodataUnavailable(
+            f"{resp.status_code}: {resp.reason} when attempting to fetch {url}"
+        )
+    return resp
+
+
+def index_repodata(
+    con: sqlite3.Connection,
+    listing: str,
+    channel: str,
+    resp: CachedResponse,
+):
+    """Index every record of the repodata, unless it already has been.
+
+    A fresh download is hashed and compared against the digest stored when the
+    listing was last indexed, so re-indexing (which takes a while for the big
+    channels) only happens when the upstream file actually changed.
+    """
+    with ingest_locks[listing]:
+        if resp.from_cache and listing_digest(con, listing) is not None:
+            return
+        digest = repodata_digest(resp.content)
+        if listing_digest(con, listing) == digest:
+            return
+
+        with status(f"Indexing {listing}"):
+            items = iter_repodata_packages(resp.content.decode())
+            records = iter_release_records(items, channel)
+            replace_listing(con, listing, digest, records)
+
+
+def repodata_digest(content: bytes) -> str:
+    # Same hash the jlap format uses to identify versions of repodata.json
+    return hashlib.blake2b(content, digest_size=32).hexdigest()
+
+
+def iter_release_records(
+    items: Iterable[tuple[str, dict]],
+    source: str,
+) -> Iterator[tuple[str, ReleaseRecord, str]]:
+    """Convert repodata (filename, record) pairs to (package, record, sort
+    key) triples for the release index."""
+    # Many files share a version string, so only key each one once
+    keys: dict[str, tuple[str, str] | None] = {}
+    for filename, file_obj in items:
+        version_str = file_obj["version"]
+        if version_str not in keys:
+            keys[version_str] = conda_version_key(version_str, quiet=True)
+        if (keyed := keys[version_str]) is None:
+            continue
+        normalized, key = keyed
+        record = ReleaseRecord(
+            filename,
+            normalized,
+            repodata_timestamp_to_datetime(file_obj.get("timestamp", 0)),
+            False,
+            file_obj.get("build", ""),
+            source,
+        )
+        yield file_obj["name"], record, key
+
+
+def iter_repodata_packages(text: str) -> Iterator[tuple[str, dict]]:
+    """Iterate over (filename, record) pairs in repodata.json text.
+
+    Records are decoded one at a time, so we never hold the whole document
+    (hundreds of thousands of records for the big channels) as Python objects.
+    """
+    decoder = json.JSONDecoder()
+    pos = expect(text, 0, "{")
+    while (pos := skip_whitespace(text, pos)) < len(text) and text[pos] != "}":
+        key, pos = decoder.raw_decode(text, pos)
+        pos = expect(text, pos, ":")
+        # .conda files live in a separate mapping from the older .tar.bz2 files
+        if key in ("packages", "packages.conda"):
+            pos = expect(text, pos, "{")
+            while (pos := skip_whitespace(text, pos)) < len(text) and text[pos] != "}":
+                filename, pos = decoder.raw_decode(text, pos)
+                pos = expect(text, pos, ":")
+                file_obj, pos = decoder.raw_decode(text, skip_whitespace(text, pos))
+                yield filename, file_obj
+                pos = skip_comma(text, pos)
+            pos = expect(text, pos, "}")
+        else:
+            _, pos = decoder.raw_decode(text, skip_whitespace(text, pos))
+        pos = skip_comma(text, pos)
+
+
+whitespace_pattern: re.Pattern = re.compile(r"[ \t\n\r]*")
+
+
+def skip_whitespace(text: str, pos: int) -> int:
+    m = whitespace_pattern.match(text, pos)
+    assert m is not None  # pattern matches the empty string
+    return m.end()
+
+
+def skip_comma(text: str, pos: int) -> int:
+    pos = skip_whitespace(text, pos)
+    if text.startswith(",", pos):
+        pos += 1
+    return pos
+
+
+def expect(text: str, pos: int, char: str) -> int:
+    pos = skip_whitespace(text, pos)
+    if not text.startswith(char, pos):
+        raise ValueError(f"Expected {char!r} at position {pos} of repodata.json")
+    return pos + 1
+
+
+def conda_version_key(version_str: str, quiet: bool = False) -> tuple[str, str] | None:
+    """Get the normalized form and sort key of a conda version string.
+
+    Plain release numbers are keyed without parsing them; see
+    plain_version_key.
+    """
+    if (key := plain_version_key(version_str)) is not None:
+        return version_str, key
+    if (version := parse_conda_version(version_str, quiet)) is None:
+        return None
+    return str(version), version_key(version)
+
+
+def parse_conda_version(version_str: str, quiet: bool = False) -> Version | None:
+    """Parse a conda version string as a PEP 440 version, if possible.
+
+    Conda versions are looser than PEP 440 (like 1.0.0_1), so fall back to the
+    longest prefix that parses. Pass quiet when indexing a whole channel,
+    where a warning per oddball version is just noise.
+    """
+    try:
+        return Version(version_str)
+    except InvalidVersion:
+        pass
+    if m := version_pattern.match(version_str):
+        return Version(m.group(0))
+    if not quiet:
+        warnings.warn(f"Unable to parse version name {version_str}")
+    return None
+
+
+def repodata_timestamp_to_datetime(timestamp: float) -> datetime.datetime:
+    """Convert a repodata timestamp to a datetime.
+
+    Timestamps are normally milliseconds since the Unix epoch, but some older
+    records use seconds. Like conda, treat anything past the year 9999 in
+    seconds as milliseconds.
+    """
+    if timestamp > 253402300799:
+        timestamp /= 1000
+    return datetime.datetime.fromtimestamp(timestamp, datetime.UTC)
+
+
+def sync_jlap(
+    con: sqlite3.Connection,
+    listing: str,
+    channel: str,
+    subdir: str,
+    as_of: datetime.datetime | None,
+) -> bool:
+    """Bring the cached repodata and its index up to date using the channel's
+    repodata.jlap, which holds JSON patches between successive versions of
+    repodata.json.
+
+    Only the tail of the jlap file since the last sync is requested, and only
+    the files touched by the patches are re-indexed. Return False if this
+    isn't possible (no earlier full download to patch, no jlap on the channel,
+    or the patch history doesn't reach back to our copy), in which case the
+    caller should download repodata.json in full.
+    """
+    url = f"{channel_url(channel)}/{subdir}/repodata.json"
+    with ingest_locks[listing]:
+        state = con.execute(
+            "SELECT position, iv, have FROM jlap WHERE listing = ?", [listing]
+        ).fetchone()
+        cached = get_cached(url)
+        if state is None or cached is None or listing_digest(con, listing) != state[2]:
+            return False
+        if as_of is not None and cached.fetched_at > as_of:
+            return True
+
+        position, iv, have = state
+        try:
+            jlap = fetch_jlap(url.removesuffix(".json") + ".jlap", position, iv)
+            patches = patch_chain(jlap, have)
+            doc = json.loads(cached.content) if patches else None
+            touched: set[str] = set()
+            with status(f"Applying {len(patches)} patch(es) to {url}"):
+                for patch in patches:
+                    doc = apply_patch(doc, patch["patch"])
+                    touched.update(touched_filenames(patch["patch"]))
+        except (JlapError, LookupError, ValueError, requests.RequestException):
+            # Includes patches that don't fit our copy of the document
+            return False
+
+        if doc is None:
+            # Nothing new, but our copy is now known to be current
+            touch_cached(url)
+        else:
+            put_cached(url, json.dumps(doc).encode())
+            items = [
+                (filename, doc[key][filename])
+                for filename in touched
+                for key in ("packages", "packages.conda")
+                if filename in doc.get(key, {})
+            ]
+            records = iter_release_records(items, channel)
+            update_listing(con, listing, jlap.latest, touched, records)
+
+        with con:
+            con.execute(
+                "INSERT OR REPLACE INTO jlap VALUES (?, ?, ?, ?)",
+                [listing, jlap.position, jlap.iv, jlap.latest],
+            )
+        return True
+
+
+def fetch_jlap(url: str, position: int, iv: str) -> Jlap:
+    """Fetch the jlap file, or just its tail after position if we have synced
+    from it before."""
+    with status(f"Fetching {url}"):
+        headers = {"Range": f"bytes={position}-"} if position else {}
+        resp = transport.get(url, headers=headers)
+        if resp.status_code == 206:
+            try:
+                return parse_jlap(resp.content, iv, position)
+            except JlapError:
+                # The file was probably trimmed and rewritten; start over
+                resp = transport.get(url)
+    # Servers that ignore Range send the whole file, which is fine too
+    resp.raise_for_status()
+    return parse_jlap(resp.content)
+
+
+def touched_filenames(operations: list[dict]) -> set[str]:
+    """Get the filenames of the package records changed by a JSON patch."""
+    res = set()
+    for op in operations:
+        for pointer in op["path"], op.get("from", ""):
+            path = parse_pointer(pointer)
+            if len(path) >= 2 and path[0] in ("packages", "packages.conda"):
+                res.add(path[1])
+            elif path and path[0] in ("packages", "packages.conda"):
+                raise JlapError("Patch replaces a whole packages mapping")
+    return res
+
+
+def start_jlap(con: sqlite3.Connection, listing: str):
+    """Record that the listing was just indexed from a full download, so that
+    the next sync reads the whole jlap file and patches from there."""
+    if (digest := listing_digest(con, listing)) is None:
+        return
+    with con:
+        con.execute(
+            "INSERT OR REPLACE INTO jlap VALUES (?, 0, '', ?)", [listing, digest]
+        )
+
+
+def repodata_listing(
+    when: datetime.datetime,
+    package: str,
+    channel: str,
+    subdir: str,
+    recheck_yanked: bool = False,
+) -> str | None:
+    """Make sure the channel subdir's repodata is indexed and return its
+    listing, or None if the channel doesn't have the subdir.
+
+    The whole subdir is indexed at once, so package only matters to the
+    other backends. Lookups of different packages in the same subdir wait for
+    each other here, so the repodata is downloaded once, and the rest find it
+    in the cache.
+    """
+    con = get_local_con()
+    as_of = None if recheck_yanked else when
+    listing = f"{channel_url(channel)}/{subdir}"
+    with ingest_locks[listing]:
+        if asof.conda_use_jlap and sync_jlap(con, listing, channel, subdir, as_of):
+            return listing
+
+        resp = fetch_repodata(channel, subdir, as_of)
+        if resp is None:
+            return None
+        index_repodata(con, listing, channel, resp)
+        if asof.conda_use_jlap and not resp.from_cache:
+            start_jlap(con, listing)
+        return listing
+
+
+def newest_conda_matches(
+    when: datetime.datetime,
+    package: str,
+    channels: Sequence[str],
+    channel_listings: Sequence[Sequence[str]],
+    channel_priority: ChannelPriority | None = None,
+    specifier: SpecifierSet | str | None = None,
+) -> MatchesOption:
+    """Find the newest release (and prerelease) of the package as of when
+    among the listings of each channel, given in order of priority.
+    """
+    records = channel_priority_releases(
+        get_local_con(),
+        channel_listings,
+        package,
+        when,
+        channel_priority or asof.conda_channel_priority,
+    )
+    if matches := select_newest(package, records, version_filters(specifier)):
+        return MatchesOption(matches, None)
+    return MatchesOption(
+        [], f"No matches for {package} available from {', '.join(channels)}"
+    )
+
+
+def channel_priority_releases(
+    con: sqlite3.Connection,
+    channel_listings: Sequence[Sequence[str]],
+    package: str,
+    when: datetime.datetime,
+    channel_priority: ChannelPriority,
+) -> Iterator[ReleaseRecord]:
+    """Merge the releases of several channels the way conda's channel_priority
+    setting does, newest version first.
+
+    Under strict priority, only the first channel that has the package (as of
+    when) counts. Under flexible priority, all channels count and the first
+    channel wins ties.
+    """
+    match channel_priority:
+        case "strict":
+            for listings in channel_listings:
+                records = iter_releases(con, listings, package, when)
+                if (first := next(records, None)) is not None:
+                    return itertools.chain([first], records)
+            return iter(())
+        case "flexible":
+            listings = [listing for ls in channel_listings for listing in ls]
+            return iter_releases(con, listings, package, when)
+        case _:
+            raise ValueError(f"Unknown channel priority {channel_priority}")
+
+
+def default_subdirs() -> list[str]:
+    if asof.conda_subdirs is not None:
+        return list(asof.conda_subdirs)
+    return [s for s in (host_subdir(), "noarch") if s is not None]
@@ -0,0 +1,94 @@
+from collections.abc import Callable, Iterable, Sequence
+from typing import Literal
+
+from packaging.specifiers import SpecifierSet
+
+import asof
+from asof.package_match import PackageMatch
+from asof.release_index import ReleaseRecord, parse_version
+
+PrereleasePolicy = Literal["newer", "never", "always"]
+# Decides whether a record can be selected at all
+RecordFilter = Callable[[ReleaseRecord], bool]
+
+
+def select_newest(
+    package: str,
+    records: Iterable[ReleaseRecord],
+    filters: Sequence[RecordFilter] = (),
+    prereleases: PrereleasePolicy | None = None,
+) -> list[PackageMatch]:
+    """Walk records newest first and pick the newest release, plus prerelease
+    according to the policy.
+
+    The cutoff and yanked files are already handled by the query that produces
+    the records (see iter_releases), since the index can do that cheaply. Each
+    filter can reject a record; cheap ones should come first. The prerelease
+    policy (by default, asof.prereleases) is one of:
+
+    - "newer": the newest release, plus the newest prerelease if it is newer
+    - "never": just the newest release
+    - "always": just the newest version, prerelease or not
+
+    Versions are parsed only for records that pass the filters.
+    """
+    return select_newest_by_mask(
+        package, records, 1, lambda _: 1, filters, prereleases
+    )[0]
+
+
+def select_newest_by_mask(
+    package: str,
+    records: Iterable[ReleaseRecord],
+    count: int,
+    mask: Callable[[ReleaseRecord], int],
+    filters: Sequence[RecordFilter] = (),
+    prereleases: PrereleasePolicy | None = None,
+) -> list[list[PackageMatch]]:
+    """Like select_newest, but for count targets at once, in a single walk.
+
+    mask gives the targets a record can be selected for, one bit per target,
+    and is called once per record. Return the matches of each target. The walk
+    stops as soon as every target has its newest release.
+    """
+    prereleases = prereleases or asof.prereleases
+    matches: list[list[PackageMatch]] = [[] for _ in range(count)]
+    # Targets still looking for their newest release
+    looking = (1 << count) - 1
+    for record in records:
+        bits = mask(record) & looking
+        if not bits or not all(f(record) for f in filters):
+            continue
+        version = parse_version(record.version)
+        for i in range(count):
+            if not bits >> i & 1:
+                continue
+            if version.is_prerelease and (prereleases == "never" or matches[i]):
+                # If we already have matches, then we already have a
+                # prerelease higher than this one
+                continue
+
+            matches[i].append(
+                PackageMatch(package, version, record.upload_time, record.source)
+            )
+            if not version.is_prerelease or prereleases == "always":
+                # Highest non-prerelease match found == done
+                looking &= ~(1 << i)
+        if not looking:
+            break
+    return matches
+
+
+def specifier_filter(specifier: SpecifierSet | str) -> RecordFilter:
+    """Only select versions that the specifier (like >=1.2,<2) allows.
+
+    Prereleases are left to the prerelease policy.
+    """
+    specifier_set = SpecifierSet(specifier) if isinstance(specifier, str) else specifier
+    return lambda record: specifier_set.contains(
+        parse_version(record.version), prereleases=True
+    )
+
+
+def version_filters(specifier: SpecifierSet | str | None) -> list[RecordFilter]:
+    return [] if specifier is None else [specifier_filter(specifier)]
@@ -0,0 +1,125 @@
+import datetime
+import hashlib
+from urllib.parse import urljoin
+
+import requests
+
+from asof import transport
+from asof.db import get_local_con
+from asof.http_cache import conditional_get
+from asof.release_index import replace_releases
+from asof.repodata import (
+    RepodataUnavailable,
+    channel_url,
+    iter_release_records,
+)
+from asof.status import status
+
+try:
+    import msgpack
+    import zstandard
+except ImportError:  # Optional; see the shards extra in pyproject.toml
+    shards_supported = False
+else:
+    shards_supported = True
+
+
+def shards_listing(
+    when: datetime.datetime,
+    package: str,
+    channel: str,
+    subdir: str,
+    recheck_yanked: bool = False,
+) -> str:
+    """Index the package's shard from the channel subdir's sharded repodata
+    (CEP 16) and return its listing.
+
+    Only the shard index and the package's own shard are downloaded, so a cold
+    lookup moves kilobytes rather than the full repodata. Shards are named by
+    their SHA-256, so a shard we have seen once never needs fetching again.
+    Raise RepodataUnavailable if the subdir has no shard index, which usually
+    means the channel doesn't serve sharded repodata at all.
+    """
+    if not shards_supported:
+        raise RepodataUnavailable(
+            "Reading sharded repodata requires msgpack and zstandard"
+        )
+    as_of = None if recheck_yanked else when
+    index_url = f"{channel_url(channel)}/{subdir}/repodata_shards.msgpack.zst"
+    index = fetch_shard_index(index_url, as_of)
+    if index is None:
+        raise RepodataUnavailable(
+            f"{channel} doesn't serve sharded repodata for {subdir}"
+        )
+
+    con = get_local_con()
+    listing = f"{channel_url(channel)}/{subdir}/shards"
+    if (shard_hash := index["shards"].get(package)) is None:
+        replace_releases(con, listing, package, [])
+        return listing
+
+    if isinstance(shard_hash, str):
+        # Spec says raw bytes, but be lenient about hex strings
+        shard_hash = bytes.fromhex(shard_hash)
+    if not (shards_base_url := index["info"].get("shards_base_url")):
+        raise RepodataUnavailable(f"Shard index {index_url} has no shards_base_url")
+    # Shard filenames are appended to the base URL, so it must be a directory
+    shards_base_url = urljoin(index_url, shards_base_url.removesuffix("/") + "/")
+    shard = fetch_shard(shards_base_url, shard_hash)
+    items = [
+        (filename, file_obj)
+        for key in ("packages", "packages.conda")
+        for filename, file_obj in shard.get(key, {}).items()
+    ]
+    records = iter_release_records(items, channel)
+    replace_releases(con, listing, package, [(r, v) for _, r, v in records])
+    return listing
+
+
+def fetch_shard_index(url: str, as_of: datetime.datetime | None) -> dict | None:
+    """Fetch (or revalidate) a shard index. Return None if there isn't one."""
+    try:
+        with status(f"Fetching {url}"):
+            resp = conditional_get(url, {}, as_of=as_of)
+    except requests.RequestException as e:
+        raise RepodataUnavailable(f"{e} when attempting to fetch {url}") from e
+
+    if resp.status_code == 404:
+        return None
+    if not resp.ok:
+        raise RepodataUnavailable(
+            f"{resp.status_code}: {resp.reason} when attempting to fetch {url}"
+        )
+    return unpack(resp.content)
+
+
+def fetch_shard(shards_base_url: str, shard_hash: bytes) -> dict:
+    """Get a shard from the cache, or download it if we haven't seen it."""
+    key = shard_hash.hex()
+    con = get_local_con()
+    fetched = con.execute(
+        "SELECT content FROM shard WHERE sha256 = ?", [key]
+    ).fetchone()
+    if fetched is not None:
+        return unpack(fetched[0])
+
+    url = f"{shards_base_url}{key}.msgpack.zst"
+    try:
+        with status(f"Fetching {url}"):
+            resp = transport.get(url)
+        resp.raise_for_status()
+    except requests.RequestException as e:
+        raise RepodataUnavailable(f"{e} when attempting to fetch {url}") from e
+    if hashlib.sha256(resp.content).digest() != shard_hash:
+        raise RepodataUnavailable(f"Checksum mismatch for {url}")
+
+    with con:
+        con.execute("INSERT OR REPLACE INTO shard VALUES (?, ?)", [key, resp.content])
+    return unpack(resp.content)
+
+
+def unpack(content: bytes) -> dict:
+    """Decompress and decode a zstd-compressed msgpack document."""
+    # decompressobj copes with frames that don't record their content size
+    data = zstandard.ZstdDecompressor().decompressobj().decompress(content)
+    return msgpack.unpackb(data)
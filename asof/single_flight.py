@@ -0,0 +1,38 @@
+import threading
+from collections.abc import Callable, Hashable
+from concurrent.futures import Future
+
+in_flight: dict[Hashable, Future[str | None]] = {}
+in_flight_lock = threading.Lock()
+
+
+def single_flight(key: Hashable, fn: Callable[[], str | None]) -> str | None:
+    """Call fn, unless another thread is already running a call with the same
+    key; then wait for that call and share its result (or exception).
+
+    In batch mode the same package often comes up several times at once, and
+    this way only one thread fetches and indexes it. Calls that start after
+    the first one finished aren't coalesced; by then its results are in the
+    cache.
+    """
+    with in_flight_lock:
+        future = in_flight.get(key)
+        if future is None:
+            future = in_flight[key] = Future()
+            leader = True
+        else:
+            leader = False
+    if not leader:
+        return future.result()
+
+    try:
+        res = fn()
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(res)
+        return res
+    finally:
+        with in_flight_lock:
+            del in_flight[key]
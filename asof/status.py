@@ -0,0 +1,15 @@
+import threading
+from contextlib import AbstractContextManager, nullcontext
+
+from rich.status import Status
+
+
+def status(message: str) -> AbstractContextManager:
+    """Show a spinner while a query runs, but only from the main thread.
+
+    Rich allows only one live display at a time, so lookups running on worker
+    threads (batch mode) stay quiet and let the caller show its own progress.
+    """
+    if threading.current_thread() is threading.main_thread():
+        return Status(message)
+    return nullcontext()
@@ -0,0 +1,214 @@
+import hashlib
+import platform
+import re
+import sys
+import sysconfig
+from collections.abc import Callable, Iterable, Iterator
+from functools import cache
+from typing import NamedTuple
+
+import packaging
+from packaging.tags import (
+    Tag,
+    compatible_tags,
+    cpython_tags,
+    generic_tags,
+    mac_platforms,
+    parse_tag,
+    sys_tags,
+)
+
+from asof.db import get_local_con
+
+interpreter_pattern: re.Pattern = re.compile(r"([a-z]+)(\d)(\d+)(t?)")
+manylinux_pattern: re.Pattern = re.compile(r"manylinux_(\d+)_(\d+)_(\w+)")
+musllinux_pattern: re.Pattern = re.compile(r"musllinux_(\d+)_(\d+)_(\w+)")
+macosx_pattern: re.Pattern = re.compile(r"macosx_(\d+)_(\d+)_(\w+)")
+
+# Legacy manylinux tags and the glibc versions they stand for
+legacy_manylinux = {
+    "manylinux2014": (2, 17),
+    "manylinux2010": (2, 12),
+    "manylinux1": (2, 5),
+}
+legacy_manylinux_arches = {
+    "manylinux2014": {
+        "x86_64",
+        "i686",
+        "aarch64",
+        "armv7l",
+        "ppc64",
+        "ppc64le",
+        "s390x",
+    },
+    "manylinux2010": {"x86_64", "i686"},
+    "manylinux1": {"x86_64", "i686"},
+}
+
+
+class Target(NamedTuple):
+    """An environment to find compatible wheels for."""
+
+    # Like cp311-manylinux_2_28_x86_64
+    name: str
+    tags: frozenset[Tag]
+
+
+class TagBitsets(NamedTuple):
+    """Which of several targets support each tag, as one bit per target.
+
+    A file is then checked against every target at once by OR-ing the masks
+    of its tags.
+    """
+
+    targets: list[Target]
+    by_tag: dict[Tag, int]
+    # Compressed tag triples (as stored in the release index) seen so far
+    by_triple: dict[str, int]
+
+    @classmethod
+    def from_targets(cls, targets: Iterable[Target]) -> "TagBitsets":
+        targets = list(targets)
+        by_tag: dict[Tag, int] = {}
+        for i, target in enumerate(targets):
+            for tag in target.tags:
+                by_tag[tag] = by_tag.get(tag, 0) | 1 << i
+        return cls(targets, by_tag, {})
+
+    @property
+    def all(self) -> int:
+        return (1 << len(self.targets)) - 1
+
+    def mask(self, triple: str) -> int:
+        """Get the targets compatible with a wheel's compressed tag triple."""
+        if (res := self.by_triple.get(triple)) is None:
+            res = 0
+            for tag in parse_tag(triple):
+                res |= self.by_tag.get(tag, 0)
+            self.by_triple[triple] = res
+        return res
+
+
+@cache
+def target_bitsets(targets: tuple[str, ...]) -> TagBitsets:
+    return TagBitsets.from_targets(parse_target(t) for t in targets)
+
+
+@cache
+def host_bitsets() -> TagBitsets:
+    return TagBitsets.from_targets([host_target()])
+
+
+@cache
+def host_target() -> Target:
+    """Get the running interpreter as a target, with the tags of sys_tags().
+
+    Generating the tags means probing the C library and platform, so they are
+    computed once per process and kept in the cache DB for later runs.
+    """
+    tags = cached_tag_set(f"host:{interpreter_fingerprint()}", sys_tags)
+    return Target("host", tags)
+
+
+def interpreter_fingerprint() -> str:
+    """Hash everything sys_tags() depends on, to key the cached tag set."""
+    parts = [
+        sys.executable,
+        sys.version,
+        sys.implementation.cache_tag or "",
+        sysconfig.get_platform(),
+        platform.machine(),
+        platform.mac_ver()[0],
+        "-".join(platform.libc_ver()),
+        # Newer packaging may know more tags (say, a new manylinux)
+        packaging.__version__,
+    ]
+    return hashlib.blake2b("\n".join(parts).encode(), digest_size=16).hexdigest()
+
+
+def cached_tag_set(key: str, tags: Callable[[], Iterable[Tag]]) -> frozenset[Tag]:
+    """Get a tag set from the cache DB, or compute and store it."""
+    con = get_local_con()
+    fetched = con.execute("SELECT tags FROM tag_set WHERE key = ?", [key]).fetchone()
+    if fetched is not None:
+        return frozenset(Tag(*t.split("-")) for t in fetched[0].split())
+
+    res = frozenset(tags())
+    with con:
+        con.execute(
+            "INSERT OR REPLACE INTO tag_set VALUES (?, ?)",
+            [key, " ".join(str(t) for t in res)],
+        )
+    return res
+
+
+@cache
+def parse_target(target: str) -> Target:
+    """Parse a target given as interpreter-platform, like
+    cp311-manylinux_2_28_x86_64 or cp312-macosx_14_0_arm64, and find the tags
+    it supports.
+
+    The platform expands to the older platforms it is compatible with, as
+    on a real machine (manylinux_2_28 accepts manylinux_2_17 wheels, macOS 14
+    accepts macOS 11 wheels, and so on). Raise ValueError if it can't be
+    parsed.
+    """
+    interpreter, sep, target_platform = target.partition("-")
+    m = interpreter_pattern.fullmatch(interpreter)
+    if not sep or not target_platform or m is None:
+        raise ValueError(f"Invalid target {target}")
+    implementation, major, minor, threaded = m.groups()
+    python_version = int(major), int(minor)
+    platforms = platform_tags(target_platform)
+
+    def tags() -> Iterator[Tag]:
+        if implementation == "cp":
+            abi = f"cp{major}{minor}{threaded}"
+            yield from cpython_tags(python_version, [abi], platforms)
+        else:
+            interpreter = f"{implementation}{major}{minor}"
+            yield from generic_tags(interpreter, ["none"], platforms)
+        yield from compatible_tags(
+            python_version, f"{implementation}{major}{minor}", platforms
+        )
+
+    key = f"target:{target}:{packaging.__version__}"
+    return Target(target, cached_tag_set(key, tags))
+
+
+def platform_tags(platform: str) -> list[str]:
+    """Expand a platform tag to all the platform tags it accepts."""
+    for legacy, glibc in legacy_manylinux.items():
+        if platform.startswith(f"{legacy}_"):
+            return manylinux_platforms(*glibc, platform.removeprefix(f"{legacy}_"))
+
+    if m := manylinux_pattern.fullmatch(platform):
+        major, minor, arch = m.groups()
+        return manylinux_platforms(int(major), int(minor), arch)
+    if m := musllinux_pattern.fullmatch(platform):
+        major, minor, arch = m.groups()
+        return [
+            *(f"musllinux_{major}_{n}_{arch}" for n in range(int(minor), -1, -1)),
+            f"linux_{arch}",
+        ]
+    if m := macosx_pattern.fullmatch(platform):
+        major, minor, arch = m.groups()
+        return list(mac_platforms((int(major), int(minor)), arch))
+    return [platform]
+
+
+def manylinux_platforms(major: int, minor: int, arch: str) -> list[str]:
+    """List the manylinux platforms a glibc version accepts, newest first.
+
+    Follows packaging's own rules for the running machine.
+    """
+    # The oldest manylinux for x86 was glibc 2.5; other arches started later
+    oldest = 5 if arch in {"x86_64", "i686"} else 17
+    res = []
+    for n in range(minor, oldest - 1, -1):
+        res.append(f"manylinux_{major}_{n}_{arch}")
+        for legacy, version in legacy_manylinux.items():
+            if version == (major, n) and arch in legacy_manylinux_arches[legacy]:
+                res.append(f"{legacy}_{arch}")
+    res.append(f"linux_{arch}")
+    return res
@@ -0,0 +1,172 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry, make_headers
+
+import asof
+
+local = threading.local()
+
+# Worth retrying: rate limiting and the usual signs of an overloaded server or
+# proxy
+retry_statuses = frozenset({429, 500, 502, 503, 504})
+# The server asking us to slow down
+throttle_statuses = frozenset({429, 503})
+
+
+class HostLimiter:
+    """Pace the requests all threads send to one host.
+
+    A token bucket caps the request rate at asof.http_rate_limit per second,
+    and the number of requests in flight is adapted to what the server
+    tolerates: halved when it pushes back with 429 or 503, and grown by about
+    one per round of successes (AIMD, as in TCP congestion control). A
+    Retry-After header pauses every thread, not just the one that got it.
+    """
+
+    def __init__(self) -> None:
+        self.cond = threading.Condition()
+        self.tokens = asof.http_rate_limit
+        self.refilled_at = time.monotonic()
+        self.limit = float(asof.http_max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+
+    def acquire(self) -> None:
+        """Wait for a token and a free slot."""
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                rate = asof.http_rate_limit
+                # Allow a burst of up to a second's worth of requests
+                self.tokens = min(rate, self.tokens + (now - self.refilled_at) * rate)
+                self.refilled_at = now
+
+                if now < self.paused_until:
+                    self.cond.wait(self.paused_until - now)
+                elif self.tokens < 1:
+                    self.cond.wait((1 - self.tokens) / rate)
+                elif self.in_flight >= int(self.limit):
+                    # Woken by release
+                    self.cond.wait()
+                else:
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    return
+
+    def release(self, resp: requests.Response | None) -> None:
+        """Free the slot and adapt to the response (None if the request
+        failed without one)."""
+        with self.cond:
+            self.in_flight -= 1
+            if resp is not None and resp.status_code in throttle_statuses:
+                self.limit = max(1.0, self.limit / 2)
+                if (delay := retry_after(resp)) is not None:
+                    self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            elif resp is not None:
+                self.limit = min(
+                    float(asof.http_max_concurrency), self.limit + 1 / self.limit
+                )
+            self.cond.notify_all()
+
+
+limiters: dict[str, HostLimiter] = {}
+limiters_lock = threading.Lock()
+
+
+def host_limiter(url: str) -> HostLimiter:
+    """Get the limiter shared by all requests to the URL's host."""
+    host = urlsplit(url).netloc
+    with limiters_lock:
+        if host not in limiters:
+            limiters[host] = HostLimiter()
+        return limiters[host]
+
+
+def retry_after(resp: requests.Response) -> float | None:
+    """Get the delay the server asked for, in seconds, if any."""
+    value = resp.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return Retry().parse_retry_after(value)
+    except ValueError:
+        return None
+
+
+def get_session() -> requests.Session:
+    """Get this thread's HTTP session.
+
+    A session keeps a pool of connections per host, so consecutive requests
+    to PyPI or a conda channel reuse one TLS connection instead of doing a new
+    handshake each time. Sessions aren't meant to be shared between threads,
+    so each worker thread gets its own, as with get_local_con.
+    """
+    if not hasattr(local, "sessions"):
+        local.sessions = {}
+    # Keyed on the retry settings so that changing them (as the tests do) works
+    key = asof.http_retries, asof.http_backoff
+    if key not in local.sessions:
+        local.sessions[key] = new_session(*key)
+    return local.sessions[key]
+
+
+def new_session(retries: int, backoff: float) -> requests.Session:
+    session = requests.Session()
+    # Only connection errors are retried down here; error statuses are retried
+    # in send, where the host's limiter gets to see them
+    retry = Retry(
+        total=retries,
+        status=0,
+        backoff_factor=backoff,
+        # Spread out retries from many threads failing at the same moment
+        backoff_jitter=backoff,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # gzip and deflate, plus br and zstd if urllib3 can decode them (that is,
+    # if brotli or zstandard is installed)
+    session.headers.update(make_headers(accept_encoding=True))
+    return session
+
+
+def get(url: str, headers: dict[str, str] | None = None) -> requests.Response:
+    """GET the URL over a pooled connection, with timeouts and retries."""
+    session = get_session()
+    return send(session.prepare_request(requests.Request("GET", url, headers)))
+
+
+def send(request: requests.PreparedRequest) -> requests.Response:
+    """Send a prepared request over a pooled connection, with timeouts and
+    retries, at the pace set by the host's limiter.
+
+    After the last retry, the last response is returned (rather than raising),
+    so that errors are reported the same way with or without retries.
+    """
+    session = get_session()
+    url = request.url or ""
+    # Proxies and CA bundles from the environment, as session.get would use
+    settings = session.merge_environment_settings(url, {}, None, None, None)
+    limiter = host_limiter(url)
+    attempt = 0
+    while True:
+        limiter.acquire()
+        resp = None
+        try:
+            resp = session.send(request, timeout=asof.http_timeout, **settings)
+        finally:
+            limiter.release(resp)
+
+        if resp.status_code not in retry_statuses or attempt >= asof.http_retries:
+            return resp
+        resp.close()
+        if retry_after(resp) is None:
+            # Otherwise, the limiter already waits as long as the server asked
+            time.sleep(asof.http_backoff * (2**attempt + random.random()))
+        attempt += 1
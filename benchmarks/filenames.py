@@ -0,0 +1,83 @@
+"""Compare the filename parser against the regex + packaging double parse.
+
+Builds a simple page shaped like a big, long-lived package with many versions
+and dozens of wheels per version, then times both ways of getting every file's
+version and tags. With asof installed (say, pip install -e .), run:
+
+    python benchmarks/filenames.py
+"""
+
+import re
+import timeit
+from functools import partial
+
+from packaging.utils import (
+    InvalidSdistFilename,
+    parse_sdist_filename,
+    parse_wheel_filename,
+)
+from packaging.version import VERSION_PATTERN, Version
+
+from asof.filenames import parse_filename
+
+version_pattern = re.compile(VERSION_PATTERN, re.VERBOSE | re.IGNORECASE)
+
+platforms = [
+    "manylinux_2_17_x86_64.manylinux2014_x86_64",
+    "manylinux_2_17_aarch64.manylinux2014_aarch64",
+    "musllinux_1_1_x86_64",
+    "macosx_10_9_x86_64",
+    "macosx_11_0_arm64",
+    "win32",
+    "win_amd64",
+]
+pythons = ["cp39", "cp310", "cp311", "cp312", "cp313"]
+
+
+def page_filenames(n_versions: int = 300) -> list[str]:
+    res = []
+    for i in range(n_versions):
+        version = f"{i // 100}.{i // 10 % 10}.{i % 10}"
+        res.append(f"demo-{version}.tar.gz")
+        for python in pythons:
+            for platform in platforms:
+                res.append(f"demo-{version}-{python}-{python}-{platform}.whl")
+    return res
+
+
+def double_parse(filenames: list[str]):
+    """What get_pypi used to do: regex to group, then packaging to check."""
+    versions = {}
+    for filename in filenames:
+        if m := version_pattern.search(filename):
+            version_str = m.group(0)
+            if version_str not in versions:
+                versions[version_str] = Version(version_str)
+        try:
+            parse_sdist_filename(filename)
+        except InvalidSdistFilename:
+            parse_wheel_filename(filename)
+
+
+def single_parse(filenames: list[str]):
+    """Split each filename once; build each distinct Version once."""
+    versions = {}
+    for filename in filenames:
+        parsed = parse_filename(filename)
+        if parsed is not None and parsed.version not in versions:
+            versions[parsed.version] = Version(parsed.version)
+
+
+def main():
+    filenames = page_filenames()
+    print(f"{len(filenames)} files")
+    results = {}
+    for fn in double_parse, single_parse:
+        seconds = min(timeit.repeat(partial(fn, filenames), number=1, repeat=5))
+        results[fn.__name__] = seconds
+        print(f"{fn.__name__}: {seconds * 1000:.1f} ms")
+    print(f"speedup: {results['double_parse'] / results['single_parse']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import datetime
+import functools
+import json
+import os
+import stat
+import sys
+import threading
+from collections.abc import Iterator
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import NamedTuple
+
+import pytest
+
+import asof
+
+
+class RecordingServer(ThreadingHTTPServer):
+    log: list[tuple[str, int]]
+
+
+class RecordingHandler(SimpleHTTPRequestHandler):
+    """Static file handler that records (path, status) of each request."""
+
+    server: RecordingServer
+
+    def log_request(self, code="-", size="-"):
+        self.server.log.append((self.path, int(code)))
+
+
+class FileServer(NamedTuple):
+    root: Path
+    url: str
+    log: list[tuple[str, int]]
+
+
+@pytest.fixture
+def tmp_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[Path]:
+    """Point the cache DB at a fresh temporary file."""
+    path = tmp_path / "cache.db"
+    monkeypatch.setattr(asof, "cache_path", path)
+    yield path
+
+
+@pytest.fixture
+def file_server(tmp_path: Path) -> Iterator[FileServer]:
+    """Serve files from a temporary directory over HTTP on localhost.
+
+    Stands in for PyPI and conda channels so tests don't need the network.
+    SimpleHTTPRequestHandler supports Last-Modified/If-Modified-Since, which is
+    enough to exercise conditional requests.
+    """
+    root = tmp_path / "www"
+    root.mkdir()
+    handler = functools.partial(RecordingHandler, directory=str(root))
+    server = RecordingServer(("127.0.0.1", 0), handler)
+    server.log = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield FileServer(root, f"http://127.0.0.1:{server.server_port}", server.log)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+# Simple index pages, for file_server to stand in for PyPI
+
+
+def write_simple_page(file_server: FileServer, package: str, files: list[dict]):
+    page = file_server.root / "simple" / package / "index.html"
+    page.parent.mkdir(parents=True, exist_ok=True)
+    page.write_text(json.dumps({"name": package, "files": files}))
+
+
+def sdist(package: str, version: str, upload_time: str, yanked=False) -> dict:
+    return {
+        "filename": f"{package}-{version}.tar.gz",
+        "upload-time": upload_time,
+        "yanked": yanked,
+    }
+
+
+@pytest.fixture
+def local_pypi(tmp_cache, file_server: FileServer, monkeypatch: pytest.MonkeyPatch):
+    """Serve simple index pages for demo (with a yanked release and a
+    prerelease) and other, and point asof.pypi_baseurl at them."""
+    monkeypatch.setattr(asof, "pypi_baseurl", file_server.url)
+    write_simple_page(
+        file_server,
+        "demo",
+        [
+            sdist("demo", "1.0", "2020-01-01T00:00:00Z"),
+            sdist("demo", "1.1", "2021-01-01T00:00:00Z"),
+            sdist("demo", "1.2", "2021-06-01T00:00:00Z", yanked=True),
+            sdist("demo", "2.0rc1", "2021-09-01T00:00:00Z"),
+            sdist("demo", "2.0", "2022-01-01T00:00:00Z"),
+        ],
+    )
+    write_simple_page(
+        file_server,
+        "other",
+        [
+            sdist("other", "1.0", "2021-01-01T00:00:00Z"),
+            sdist("other", "1.1", "2022-01-01T00:00:00Z"),
+        ],
+    )
+    yield file_server
+
+
+# Conda repodata
+
+
+def record(
+    name: str, version: str, timestamp: str, build: str = "h1_0", **extra
+) -> dict:
+    """Make a repodata record, with any extra fields."""
+    dt = datetime.datetime.fromisoformat(timestamp)
+    return {
+        "name": name,
+        "version": version,
+        "build": build,
+        "timestamp": int(dt.timestamp() * 1000),
+        **extra,
+    }
+
+
+FAKE_CONDA = """\
+#!{python}
+import json, sys
+if sys.argv[1] == "--version":
+    print({version!r})
+    sys.exit()
+with open({log!r}, "a") as f:
+    f.write(" ".join(sys.argv[1:]) + "\\n")
+print(json.dumps({{"demo": {records!r}}}))
+"""
+
+RECORDS = [
+    {
+        "name": "demo",
+        "version": "1.0",
+        "build": "py_0",
+        "timestamp": 1600000000000,
+        "fn": "demo-1.0-py_0.conda",
+        "channel": "https://conda.anaconda.org/conda-forge/noarch",
+    },
+    {
+        "name": "demo",
+        "version": "2.0",
+        "build": "py_0",
+        "timestamp": 1700000000000,
+        "fn": "demo-2.0-py_0.conda",
+        "channel": "https://conda.anaconda.org/conda-forge/noarch",
+    },
+]
+
+
+@pytest.fixture
+def fake_conda(
+    tmp_path: Path, tmp_cache: Path, monkeypatch: pytest.MonkeyPatch
+) -> Path:
+    """Put a conda that answers searches from RECORDS first on the PATH.
+
+    Return the file where it logs the arguments of each search.
+    """
+    return install_fake_conda(tmp_path / "bin", monkeypatch)
+
+
+def install_fake_conda(
+    bin_dir: Path, monkeypatch: pytest.MonkeyPatch, version: str = "conda 24.1.0"
+) -> Path:
+    """Put a conda that answers searches from RECORDS in bin_dir, first on the
+    PATH. Return the file where it logs the arguments of each search."""
+    bin_dir.mkdir()
+    log = bin_dir / "searches.log"
+    log.touch()
+    exe = bin_dir / "conda"
+    exe.write_text(
+        FAKE_CONDA.format(
+            python=sys.executable, log=str(log), records=RECORDS, version=version
+        )
+    )
+    exe.chmod(exe.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return log
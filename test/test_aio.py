@@ -0,0 +1,54 @@
+import asyncio
+import datetime
+import sys
+from pathlib import Path
+
+import pytest
+from conftest import FileServer
+from packaging.version import Version
+
+from asof.aio import aget_conda, aget_pypi, aget_pypi_targets, aresolve_many
+from asof.canonical_names import CanonicalNames
+
+when = datetime.datetime.fromisoformat("2022-06-01T00:00:00Z")
+
+
+def test_aget_pypi(local_pypi: FileServer):
+    res = asyncio.run(aget_pypi(when, "demo"))
+    assert [m.version for m in res.matches] == [Version("2.0")]
+
+
+def test_aget_pypi_targets(local_pypi: FileServer):
+    targets = ["cp312-manylinux_2_28_x86_64", "cp312-win_amd64"]
+    res = asyncio.run(aget_pypi_targets(when, "demo", targets))
+    assert {p: [m.version for m in r.matches] for p, r in res.by_platform.items()} == {
+        t: [Version("2.0")] for t in targets
+    }
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="fake conda needs shebang support")
+def test_aget_conda__search(fake_conda: Path):
+    async def search_twice():
+        return await asyncio.gather(
+            aget_conda(when, "demo", conda_command="conda"),
+            aget_conda(when, "demo", conda_command="conda", channels=["bioconda"]),
+        )
+
+    for res in asyncio.run(search_twice()):
+        assert [m.version for m in res.matches] == [Version("1.0")]
+    searches = fake_conda.read_text().splitlines()
+    assert sorted(searches) == [
+        "search --json --channel bioconda --override-channels demo --skip-flexible-search",
+        "search --json demo --skip-flexible-search",
+    ]
+
+
+def test_aresolve_many(local_pypi: FileServer):
+    names = [CanonicalNames(None, "demo"), CanonicalNames(None, "other")]
+
+    async def collect():
+        return [r async for r in aresolve_many(when, names)]
+
+    res = asyncio.run(collect())
+    assert [pypi.matches[0].package_name for pypi, _ in res] == ["demo", "other"]
+    assert all(conda.message == "No conda name to search for" for _, conda in res)
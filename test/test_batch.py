@@ -0,0 +1,108 @@
+import datetime
+import io
+import sys
+import threading
+
+import pytest
+from conftest import FileServer
+
+from asof import batch
+from asof.__main__ import get_parser, get_queries, main
+from asof.batch import read_queries, resolve_many
+from asof.canonical_names import CanonicalNames
+from asof.package_match import MatchesOption
+
+when = datetime.datetime.fromisoformat("2022-06-01T00:00:00Z")
+
+
+class TtyStdin(io.StringIO):
+    def isatty(self) -> bool:
+        return True
+
+
+def test_read_queries():
+    lines = [
+        "# Pinned for the cooldown policy\n",
+        "\n",
+        "--index-url https://pypi.org/simple\n",
+        "-e .\n",
+        "numpy>=2\n",
+        "pandas[performance] ~= 2.2  # inline comment\n",
+        'pywin32; sys_platform == "win32"\n',
+        "not a requirement!\n",
+    ]
+    assert read_queries(lines) == ["numpy", "pandas", "pywin32"]
+
+
+def test_get_queries__stdin(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(sys, "stdin", io.StringIO("numpy>=2\npandas\n"))
+    options = get_parser().parse_args(["2024-01-01"])
+    assert get_queries(options) == ["numpy", "pandas"]
+
+    # Queries on the command line take the place of stdin
+    monkeypatch.setattr(sys, "stdin", io.StringIO("numpy>=2\n"))
+    options = get_parser().parse_args(["2024-01-01", "scipy"])
+    assert get_queries(options) == ["scipy"]
+
+
+def test_get_queries__requirement(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    requirements = tmp_path / "requirements.txt"
+    requirements.write_text("# Comment\nrequests==2.31\n")
+    monkeypatch.setattr(sys, "stdin", io.StringIO("numpy>=2\n"))
+    options = get_parser().parse_args(
+        ["2024-01-01", "scipy", "-r", str(requirements), "-r", "-"]
+    )
+    assert get_queries(options) == ["scipy", "requests", "numpy"]
+
+
+def test_main__no_packages(monkeypatch: pytest.MonkeyPatch, capsys):
+    monkeypatch.setattr(sys, "stdin", TtyStdin())
+    monkeypatch.setattr(sys, "argv", ["asof", "2024-01-01"])
+    with pytest.raises(SystemExit) as exc_info:
+        main()
+    assert exc_info.value.code == 2
+    assert "no packages given to search for" in capsys.readouterr().err
+
+
+def test_resolve_many__input_order(
+    local_pypi: FileServer, monkeypatch: pytest.MonkeyPatch
+):
+    # Hold the first lookup back until the other is done
+    finished: list[str] = []
+    other_done = threading.Barrier(2)
+    get_pypi = batch.get_pypi
+
+    def out_of_order_get_pypi(when, package, **kwargs) -> MatchesOption:
+        if package == "demo":
+            other_done.wait(timeout=5)
+        res = get_pypi(when, package, **kwargs)
+        finished.append(package)
+        if package != "demo":
+            other_done.wait(timeout=5)
+        return res
+
+    monkeypatch.setattr(batch, "get_pypi", out_of_order_get_pypi)
+    names = [CanonicalNames(None, p) for p in ["demo", "other"]]
+    res = list(resolve_many(when, names))
+    assert finished[-1] == "demo"
+    packages = [
+        pypi.matches[0].package_name
+        for pypi, _ in res
+        if isinstance(pypi, MatchesOption)
+    ]
+    assert packages == ["demo", "other"]
+
+
+def test_resolve_many__error(local_pypi: FileServer):
+    # A page that isn't JSON fails that package's lookup, not the batch
+    page = local_pypi.root / "simple" / "broken" / "index.html"
+    page.parent.mkdir(parents=True)
+    page.write_text("<html>Not JSON</html>")
+    names = [CanonicalNames(None, p) for p in ["broken", "demo"]]
+    (broken, _), (demo, _) = resolve_many(when, names)
+    assert isinstance(broken, MatchesOption)
+    assert broken.matches == []
+    assert broken.message is not None
+    assert broken.message.startswith("Unable to query PyPI for broken: JSONDecodeError")
+    assert isinstance(demo, MatchesOption)
+    assert [m.package_name for m in demo.matches] == ["demo"]
@@ -0,0 +1,114 @@
+import datetime
+import sys
+import threading
+import types
+from typing import NamedTuple
+
+import pytest
+from packaging.version import Version
+
+import asof
+from asof import conda_api
+from asof.conda import get_conda
+
+
+class FakeRecord(NamedTuple):
+    fn: str
+    name: str
+    version: str
+    build: str
+    timestamp: float
+
+
+class FakeSubdirData:
+    """Stands in for conda.api.SubdirData, which needs conda installed."""
+
+    loads = 0
+    # If set, queries wait here for each other
+    barrier: threading.Barrier | None = None
+
+    def __init__(self, channel: str):
+        FakeSubdirData.loads += 1
+        self.subdir = channel.split("/")[-1]
+
+    def reload(self):
+        FakeSubdirData.loads += 1
+
+    def query(self, package: str):
+        if self.barrier is not None:
+            self.barrier.wait()
+        if self.subdir == "noarch":
+            return []
+        t = datetime.datetime(2020, 1, 1, tzinfo=datetime.UTC).timestamp()
+        return [
+            FakeRecord(f"{package}-1.0-h1_0.conda", package, "1.0", "h1_0", t),
+            FakeRecord(f"{package}-2.0-h1_0.conda", package, "2.0", "h1_0", t * 2),
+        ]
+
+
+@pytest.fixture
+def fake_conda(tmp_cache, monkeypatch: pytest.MonkeyPatch):
+    api = types.ModuleType("conda.api")
+    api.SubdirData = FakeSubdirData  # type: ignore[attr-defined]
+    channel = types.ModuleType("conda.models.channel")
+    channel.Channel = str  # type: ignore[attr-defined]
+    for name, module in [
+        ("conda", types.ModuleType("conda")),
+        ("conda.api", api),
+        ("conda.models", types.ModuleType("conda.models")),
+        ("conda.models.channel", channel),
+    ]:
+        monkeypatch.setitem(sys.modules, name, module)
+    monkeypatch.setattr(asof, "conda_subdirs", ["linux-64", "noarch"])
+    monkeypatch.setattr(asof, "conda_backends", ["conda-api"])
+    monkeypatch.setattr(conda_api, "subdir_data", {})
+    monkeypatch.setattr(FakeSubdirData, "loads", 0)
+    conda_api.conda_api.cache_clear()
+    yield
+    conda_api.conda_api.cache_clear()
+
+
+def test_get_conda__api(fake_conda):
+    when = datetime.datetime(2021, 1, 1, tzinfo=datetime.UTC)
+    res = get_conda(when, "demo", channels=["conda-forge"])
+    assert [m.version for m in res.matches] == [Version("1.0")]
+
+    # Loaded channel data is reused by later queries
+    get_conda(when, "other", channels=["conda-forge"])
+    assert FakeSubdirData.loads == 2
+
+
+def test_get_conda__api_reload(fake_conda, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(asof, "conda_api_lifetime", datetime.timedelta(0))
+    when = datetime.datetime(2021, 1, 1, tzinfo=datetime.UTC)
+    get_conda(when, "demo", channels=["conda-forge"])
+
+    # Loaded after the cutoff, so good for it however old
+    get_conda(when, "other", channels=["conda-forge"])
+    assert FakeSubdirData.loads == 2
+
+    # But a later cutoff needs the subdirs reloaded
+    later = datetime.datetime.now(datetime.UTC) + datetime.timedelta(days=1)
+    get_conda(later, "demo", channels=["conda-forge"])
+    assert FakeSubdirData.loads == 4
+
+
+def test_get_conda__api_concurrent_subdirs(fake_conda, monkeypatch: pytest.MonkeyPatch):
+    # Only passes if both subdirs are loaded at the same time
+    monkeypatch.setattr(FakeSubdirData, "barrier", threading.Barrier(2, timeout=5))
+    when = datetime.datetime(2021, 1, 1, tzinfo=datetime.UTC)
+    res = get_conda(when, "demo", channels=["conda-forge"])
+    assert [m.version for m in res.matches] == [Version("1.0")]
+
+
+def test_get_conda__api_not_installed(tmp_cache, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setitem(sys.modules, "conda.api", None)
+    monkeypatch.setattr(asof, "conda_backends", ["conda-api"])
+    monkeypatch.setattr(asof, "conda_subdirs", ["linux-64"])
+    conda_api.conda_api.cache_clear()
+    try:
+        res = get_conda(datetime.datetime.now(datetime.UTC), "demo")
+        assert res.matches == []
+        assert res.message == "conda's Python API isn't importable"
+    finally:
+        conda_api.conda_api.cache_clear()
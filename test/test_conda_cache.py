@@ -0,0 +1,85 @@
+import datetime
+import json
+import os
+from pathlib import Path
+
+import pytest
+from conftest import record
+from packaging.version import Version
+
+import asof
+from asof.conda import get_conda
+
+channel_baseurl = "https://conda.example.org"
+
+
+# Has braces in a string, which decoding one record at a time has to cope with
+DEPENDS = ["python >=3.8", "weird {brace} dep"]
+
+
+@pytest.fixture
+def pkgs_dir(tmp_cache, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    pkgs = tmp_path / "pkgs"
+    (pkgs / "cache").mkdir(parents=True)
+    monkeypatch.setenv("CONDA_PKGS_DIRS", str(pkgs))
+    monkeypatch.setattr(asof, "conda_channel_baseurl", channel_baseurl)
+    monkeypatch.setattr(asof, "conda_subdirs", ["linux-64", "noarch"])
+    monkeypatch.setattr(asof, "conda_backends", ["conda-cache"])
+
+    # Newer conda style: URL in a sidecar file
+    linux = {
+        "info": {"subdir": "linux-64"},
+        "packages": {
+            "demo-1.0-h1_0.tar.bz2": record(
+                "demo", "1.0", "2020-01-01T00:00Z", depends=DEPENDS
+            ),
+            "demo-extra-9.0-h1_0.tar.bz2": record(
+                "demo-extra", "9.0", "2020-01-01T00:00Z", depends=DEPENDS
+            ),
+        },
+        "packages.conda": {
+            "demo-2.0-h1_0.conda": record(
+                "demo", "2.0", "2022-01-01T00:00Z", depends=DEPENDS
+            ),
+        },
+    }
+    (pkgs / "cache" / "0123abcd.json").write_text(json.dumps(linux, indent=1))
+    (pkgs / "cache" / "0123abcd.info.json").write_text(
+        json.dumps({"url": f"{channel_baseurl}/conda-forge/linux-64/repodata.json"})
+    )
+
+    # Older conda style: URL inline
+    noarch = {
+        "_url": f"{channel_baseurl}/conda-forge/noarch",
+        "packages": {
+            "demo-1.5-pyh_0.tar.bz2": record(
+                "demo", "1.5", "2021-01-01T00:00Z", depends=DEPENDS
+            ),
+        },
+    }
+    (pkgs / "cache" / "4567ef00.json").write_text(json.dumps(noarch))
+    yield pkgs
+
+
+def test_get_conda__cache(pkgs_dir: Path):
+    when = datetime.datetime.fromisoformat("2021-06-01T00:00Z")
+    res = get_conda(when, "demo", channels=["conda-forge"])
+    assert [m.version for m in res.matches] == [Version("1.5")]
+
+
+def test_get_conda__cache_stale(pkgs_dir: Path):
+    # Cache files are older than the cutoff, so they can't be trusted
+    old = datetime.datetime.fromisoformat("2021-01-01T00:00Z").timestamp()
+    for path in (pkgs_dir / "cache").iterdir():
+        os.utime(path, (old, old))
+    when = datetime.datetime.fromisoformat("2021-06-01T00:00Z")
+    res = get_conda(when, "demo", channels=["conda-forge"])
+    assert res.matches == []
+    assert res.message is not None and "predates" in res.message
+
+
+def test_get_conda__cache_missing_channel(pkgs_dir: Path):
+    when = datetime.datetime.fromisoformat("2021-06-01T00:00Z")
+    res = get_conda(when, "demo", channels=["bioconda"])
+    assert res.matches == []
+    assert res.message is not None and "No conda cache" in res.message
@@ -0,0 +1,42 @@
+import pytest
+
+from asof.filenames import DistFilename, parse_filename
+
+
+@pytest.mark.parametrize(
+    "filename,expected",
+    [
+        (
+            "numpy-2.1.0-cp312-cp312-manylinux_2_17_x86_64.manylinux2014_x86_64.whl",
+            DistFilename(
+                "numpy",
+                "2.1.0",
+                "",
+                "cp312-cp312-manylinux_2_17_x86_64.manylinux2014_x86_64",
+            ),
+        ),
+        (
+            "demo-1.0-1local-py3-none-any.whl",
+            DistFilename("demo", "1.0", "1local", "py3-none-any"),
+        ),
+        (
+            "python-dateutil-2.9.0.tar.gz",
+            DistFilename("python-dateutil", "2.9.0", "", ""),
+        ),
+        ("demo-1.0rc1.zip", DistFilename("demo", "1.0rc1", "", "")),
+        ("demo-1.0-py2.7.egg", None),
+        ("demo-1.0.win32.exe", None),
+        ("demo-1.0.whl", None),
+        ("demo.tar.gz", None),
+    ],
+)
+def test_parse_filename(filename: str, expected: DistFilename | None):
+    assert parse_filename(filename) == expected
+
+
+def test_parse_filename__interned():
+    a = parse_filename("demo-1.0-cp312-cp312-win_amd64.whl")
+    b = parse_filename("demo-1.0-cp312-cp312-win_amd64.whl")
+    assert a is not None and b is not None
+    assert a.version is b.version
+    assert a.tags is b.tags
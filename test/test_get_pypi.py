@@ -1,11 +1,16 @@
 import datetime
+import json
 import re
 
 import pytest
+from conftest import FileServer, sdist, write_simple_page
 from packaging.version import Version
 
+import asof
+from asof.db import get_local_con
 from asof.package_match import PackageMatch
-from asof.pypi import get_pypi
+from asof.pypi import get_pypi, get_pypi_targets, index_page
+from asof.release_index import set_listing_digest
 
 
 @pytest.mark.parametrize(
@@ -50,3 +55,120 @@ def test_get_pypi__empty(when: datetime.datetime, package: str):
         f"404: Not Found when attempting to get query PyPI at .*/{package}/",
         res.message,
     )
+
+
+# Offline tests against a local stand-in for the simple index
+
+
+def test_get_pypi__local(local_pypi: FileServer):
+    when = datetime.datetime.fromisoformat("2021-12-01T00:00:00Z")
+    res = get_pypi(when, "demo")
+    assert [m.version for m in res.matches] == [Version("2.0rc1"), Version("1.1")]
+    assert res.message is None
+
+    # A lookup with a later cutoff revalidates the cached page rather than
+    # downloading it again
+    get_pypi(datetime.datetime.now(datetime.UTC), "demo")
+    assert [status for _, status in local_pypi.log] == [200, 304]
+
+
+def test_get_pypi__normalized(local_pypi: FileServer):
+    when = datetime.datetime.fromisoformat("2022-06-01T00:00:00Z")
+    res = get_pypi(when, "Demo")
+    assert [m.version for m in res.matches] == [Version("2.0")]
+    assert res.matches[0].package_name == "Demo"
+    assert [path for path, _ in local_pypi.log] == ["/simple/demo/"]
+
+
+def test_get_pypi__not_found(local_pypi: FileServer):
+    # The error names the package as given, though the normalized name was asked
+    when = datetime.datetime.fromisoformat("2022-06-01T00:00:00Z")
+    res = get_pypi(when, "No_Such.Package")
+    assert res.matches == []
+    assert res.message == (
+        f"404: File not found when attempting to get query PyPI at "
+        f"{local_pypi.url}/simple/No_Such.Package/"
+    )
+    assert [path for path, _ in local_pypi.log] == ["/simple/no-such-package/"]
+
+
+def test_get_pypi__specifier(local_pypi: FileServer):
+    when = datetime.datetime.fromisoformat("2022-06-01T00:00:00Z")
+    res = get_pypi(when, "demo", specifier="<1.1")
+    assert [m.version for m in res.matches] == [Version("1.0")]
+
+
+def test_get_pypi__local_historical(local_pypi: FileServer):
+    # Page is cached now, so any earlier cutoff is answered from the cache
+    when = datetime.datetime.fromisoformat("2021-12-01T00:00:00Z")
+    get_pypi(when, "demo")
+    res = get_pypi(datetime.datetime.fromisoformat("2020-06-01T00:00:00Z"), "demo")
+    assert [m.version for m in res.matches] == [Version("1.0")]
+    assert len(local_pypi.log) == 1
+
+    get_pypi(when, "demo", recheck_yanked=True)
+    assert len(local_pypi.log) == 2
+
+    # Cutoff after the fetch time has to revalidate
+    get_pypi(datetime.datetime.now(datetime.UTC), "demo")
+    assert len(local_pypi.log) == 3
+
+
+def test_get_pypi__reindex_other_copy(local_pypi: FileServer):
+    when = datetime.datetime.fromisoformat("2022-06-01T00:00:00Z")
+    get_pypi(when, "demo")
+
+    # Say a lagging mirror's copy of the page got indexed since
+    con = get_local_con()
+    lagging = [sdist("demo", "1.0", "2020-01-01T00:00:00Z")]
+    index_page(con, "demo", json.dumps({"files": lagging}).encode())
+    set_listing_digest(con, f"{local_pypi.url}/simple/demo/", "lagging")
+
+    # The cached copy from pypi_baseurl is good for the cutoff, but it isn't
+    # what the index holds
+    res = get_pypi(when, "demo")
+    assert [m.version for m in res.matches] == [Version("2.0")]
+    assert len(local_pypi.log) == 1
+
+
+def wheel(package: str, version: str, tags: str, upload_time: str) -> dict:
+    return {
+        "filename": f"{package}-{version}-{tags}.whl",
+        "upload-time": upload_time,
+        "yanked": False,
+    }
+
+
+def test_get_pypi_targets(tmp_cache, file_server: FileServer, monkeypatch):
+    monkeypatch.setattr(asof, "pypi_baseurl", file_server.url)
+    write_simple_page(
+        file_server,
+        "ext",
+        [
+            wheel("ext", "1.0", "cp311-cp311-win_amd64", "2020-01-01T00:00:00Z"),
+            wheel(
+                "ext",
+                "1.0",
+                "cp311-cp311-manylinux_2_17_x86_64.manylinux2014_x86_64",
+                "2020-01-01T00:00:00Z",
+            ),
+            wheel("ext", "2.0", "cp312-cp312-win_amd64", "2021-01-01T00:00:00Z"),
+            wheel("ext", "2.1", "cp311-abi3-win_amd64", "2021-02-01T00:00:00Z"),
+        ],
+    )
+    when = datetime.datetime.fromisoformat("2022-01-01T00:00:00Z")
+    targets = [
+        "cp311-manylinux_2_28_x86_64",
+        "cp312-win_amd64",
+        "cp312-macosx_14_0_arm64",
+    ]
+    res = get_pypi_targets(when, "ext", targets)
+    assert {
+        target: [m.version for m in option.matches]
+        for target, option in res.by_platform.items()
+    } == {
+        "cp311-manylinux_2_28_x86_64": [Version("1.0")],
+        "cp312-win_amd64": [Version("2.1")],
+        "cp312-macosx_14_0_arm64": [],
+    }
+    assert len(file_server.log) == 1
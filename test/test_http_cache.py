@@ -0,0 +1,56 @@
+import datetime
+
+from conftest import FileServer
+
+from asof.db import get_local_con
+from asof.http_cache import conditional_get
+
+
+def test_conditional_get(tmp_cache, file_server: FileServer):
+    (file_server.root / "page.json").write_text('{"files": []}')
+    url = f"{file_server.url}/page.json"
+
+    first = conditional_get(url, {})
+    assert first.ok
+    assert not first.from_cache
+    assert first.content == b'{"files": []}'
+
+    second = conditional_get(url, {})
+    assert second.ok
+    assert second.from_cache
+    assert second.content == first.content
+    assert second.fetched_at >= first.fetched_at
+    assert file_server.log == [("/page.json", 200), ("/page.json", 304)]
+
+
+def test_conditional_get__not_found(tmp_cache, file_server: FileServer):
+    res = conditional_get(f"{file_server.url}/missing.json", {})
+    assert res.status_code == 404
+    assert not res.ok
+
+
+def test_conditional_get__as_of(tmp_cache, file_server: FileServer):
+    (file_server.root / "page.json").write_text("{}")
+    url = f"{file_server.url}/page.json"
+
+    first = conditional_get(url, {})
+    before = first.fetched_at - datetime.timedelta(days=1)
+    assert conditional_get(url, {}, as_of=before).from_cache
+    assert len(file_server.log) == 1
+
+
+def test_conditional_get__lazy_content(tmp_cache, file_server: FileServer):
+    (file_server.root / "page.json").write_text("{}")
+    url = f"{file_server.url}/page.json"
+    first = conditional_get(url, {})
+
+    statements: list[str] = []
+    get_local_con().set_trace_callback(statements.append)
+    try:
+        before = first.fetched_at - datetime.timedelta(days=1)
+        cached = conditional_get(url, {}, as_of=before)
+        assert not any("content" in s for s in statements)
+        assert cached.content == b"{}"
+        assert any("content" in s for s in statements)
+    finally:
+        get_local_con().set_trace_callback(None)
@@ -0,0 +1,125 @@
+import datetime
+import hashlib
+import json
+from pathlib import Path
+
+import pytest
+from conftest import FileServer, record
+from packaging.version import Version
+
+import asof
+from asof.conda import get_conda
+from asof.jlap import JlapError, apply_patch, parse_jlap, patch_chain
+from asof.repodata import repodata_digest
+
+
+def write_jlap(path: Path, patches: list[dict], latest: str) -> bytes:
+    """Write a jlap file the way a channel server would."""
+    lines = [("00" * 32).encode()]
+    lines += [json.dumps(p).encode() for p in patches]
+    lines.append(json.dumps({"url": "repodata.json", "latest": latest}).encode())
+    chain = bytes(32)
+    for line in lines[1:]:
+        chain = hashlib.blake2b(line, key=chain, digest_size=32).digest()
+    lines.append(chain.hex().encode())
+    content = b"\n".join(lines)
+    path.write_bytes(content)
+    return content
+
+
+def test_parse_jlap(tmp_path: Path):
+    patches = [
+        {"from": "a", "to": "b", "patch": []},
+        {"from": "b", "to": "c", "patch": []},
+    ]
+    content = write_jlap(tmp_path / "repodata.jlap", patches, "c")
+    jlap = parse_jlap(content)
+    assert jlap.patches == patches
+    assert jlap.latest == "c"
+    assert patch_chain(jlap, "b") == patches[1:]
+    with pytest.raises(JlapError):
+        patch_chain(jlap, "z")
+
+    # Tail of the file, as returned for a range request
+    tail = parse_jlap(content[jlap.position :], jlap.iv, jlap.position)
+    assert tail.patches == []
+    assert tail.position == jlap.position
+
+    with pytest.raises(JlapError):
+        parse_jlap(content.replace(b'"c"', b'"d"'))
+
+
+def test_apply_patch():
+    doc = {"packages": {"a": {"depends": ["x"]}}, "removed": []}
+    res = apply_patch(
+        doc,
+        [
+            {"op": "add", "path": "/packages/b~1c", "value": {"depends": []}},
+            {"op": "add", "path": "/packages/a/depends/-", "value": "y"},
+            {"op": "replace", "path": "/packages/a/depends/0", "value": "z"},
+            {"op": "move", "from": "/packages/b~1c", "path": "/packages/d"},
+            {"op": "copy", "from": "/packages/d", "path": "/packages/e"},
+            {"op": "remove", "path": "/packages/d"},
+            {"op": "test", "path": "/removed", "value": []},
+        ],
+    )
+    assert res == {
+        "packages": {"a": {"depends": ["z", "y"]}, "e": {"depends": []}},
+        "removed": [],
+    }
+
+
+def test_get_conda__jlap(
+    tmp_cache, file_server: FileServer, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(asof, "conda_channel_baseurl", file_server.url)
+    monkeypatch.setattr(asof, "conda_backends", ["repodata"])
+    monkeypatch.setattr(asof, "conda_subdirs", ["linux-64"])
+    subdir = file_server.root / "conda-forge" / "linux-64"
+    subdir.mkdir(parents=True)
+
+    v1 = {
+        "packages": {},
+        "packages.conda": {
+            "demo-1.0-h1_0.conda": record("demo", "1.0", "2020-01-01T00:00Z")
+        },
+    }
+    v1_bytes = json.dumps(v1).encode()
+    (subdir / "repodata.json").write_bytes(v1_bytes)
+    res = get_conda(
+        datetime.datetime.now(datetime.UTC), "demo", channels=["conda-forge"]
+    )
+    assert [m.version for m in res.matches] == [Version("1.0")]
+
+    # The server's repodata.json stays at v1; only the jlap knows about 2.0
+    add_2 = {
+        "from": repodata_digest(v1_bytes),
+        "to": "v2",
+        "patch": [
+            {
+                "op": "add",
+                "path": "/packages.conda/demo-2.0-h1_0.conda",
+                "value": record("demo", "2.0", "2021-01-01T00:00Z"),
+            }
+        ],
+    }
+    write_jlap(subdir / "repodata.jlap", [add_2], "v2")
+    res = get_conda(
+        datetime.datetime.now(datetime.UTC), "demo", channels=["conda-forge"]
+    )
+    assert [m.version for m in res.matches] == [Version("2.0")]
+
+    remove_2 = {
+        "from": "v2",
+        "to": "v3",
+        "patch": [{"op": "remove", "path": "/packages.conda/demo-2.0-h1_0.conda"}],
+    }
+    write_jlap(subdir / "repodata.jlap", [add_2, remove_2], "v3")
+    res = get_conda(
+        datetime.datetime.now(datetime.UTC), "demo", channels=["conda-forge"]
+    )
+    assert [m.version for m in res.matches] == [Version("1.0")]
+
+    paths = [path for path, _ in file_server.log]
+    assert paths.count("/conda-forge/linux-64/repodata.json") == 1
+    assert paths.count("/conda-forge/linux-64/repodata.jlap") == 2
@@ -0,0 +1,138 @@
+import datetime
+import socket
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+from conftest import FileServer, sdist, write_simple_page
+from packaging.version import Version
+
+import asof
+from asof import mirrors
+from asof.mirrors import MirrorHealth, hedged_get
+from asof.pypi import get_pypi
+
+when = datetime.datetime.fromisoformat("2022-06-01T00:00:00Z")
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(1)
+        self.send_response(503)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def slow_server() -> Iterator[str]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def dead_server(monkeypatch: pytest.MonkeyPatch) -> str:
+    """A URL nothing listens on."""
+    monkeypatch.setattr(asof, "http_retries", 0)
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+
+@pytest.fixture
+def mirror(tmp_cache, file_server: FileServer) -> FileServer:
+    write_simple_page(
+        file_server, "demo", [sdist("demo", "1.0", "2021-01-01T00:00:00Z")]
+    )
+    return file_server
+
+
+def test_hedged_get__failover(mirror: FileServer, dead_server: str):
+    resp = hedged_get([dead_server, mirror.url], "/simple/demo/", {})
+    assert resp.ok
+    assert b"demo-1.0.tar.gz" in resp.content
+
+
+def test_hedged_get__hedge(
+    mirror: FileServer, slow_server: str, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(asof, "pypi_hedge_delay", 0.1)
+    start = time.monotonic()
+    resp = hedged_get([slow_server, mirror.url], "/simple/demo/", {})
+    assert resp.ok
+    assert time.monotonic() - start < 1
+
+
+def test_hedged_get__queued(
+    mirror: FileServer, slow_server: str, monkeypatch: pytest.MonkeyPatch
+):
+    # Time spent waiting for a thread doesn't count towards the hedging delay
+    monkeypatch.setattr(asof, "pypi_hedge_delay", 0.1)
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(mirrors, "hedge_executor", executor)
+    asked: list[str] = []
+    mirror_get = mirrors.mirror_get
+
+    def recording_get(baseurl, *args):
+        asked.append(baseurl)
+        return mirror_get(baseurl, *args)
+
+    monkeypatch.setattr(mirrors, "mirror_get", recording_get)
+    executor.submit(time.sleep, 0.5)
+    resp = hedged_get([mirror.url, slow_server], "/simple/demo/", {})
+    executor.shutdown()
+    assert resp.ok
+    assert asked == [mirror.url]
+
+
+def test_hedged_get__all_failing(dead_server: str):
+    with pytest.raises(requests.ConnectionError):
+        hedged_get([dead_server, dead_server.replace("http", "https")], "/", {})
+
+
+def test_get_pypi__mirror(
+    mirror: FileServer, dead_server: str, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(asof, "pypi_baseurl", dead_server)
+    monkeypatch.setattr(asof, "pypi_mirrors", [mirror.url])
+    res = get_pypi(when, "demo")
+    assert [m.version for m in res.matches] == [Version("1.0")]
+    assert res.matches[0].source == dead_server
+
+
+def test_mirror_health__circuit_breaker(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(asof, "mirror_failure_limit", 2)
+    health = MirrorHealth()
+    health.record(False, None)
+    assert health.available()
+    health.record(False, None)
+    assert not health.available()
+
+    # Once the cooldown is over, one request gets through
+    health.open_until = 0.0
+    assert health.available()
+    assert not health.available()
+    health.record(True, 0.1)
+    assert health.available()
+
+
+def test_mirror_health__hedge_delay(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(asof, "pypi_hedge_delay", 5.0)
+    health = MirrorHealth()
+    assert health.hedge_delay() == 5.0
+    for i in range(1, 101):
+        health.record(True, i / 100)
+    assert 0.9 < health.hedge_delay() < 1
@@ -0,0 +1,108 @@
+import datetime
+import random
+
+from packaging.version import Version
+
+from asof.db import get_local_con
+from asof.release_index import (
+    ReleaseRecord,
+    iter_releases,
+    plain_version_key,
+    releases_query,
+    replace_releases,
+    sort_key,
+    version_key,
+)
+
+versions = [
+    Version(s)
+    for s in [
+        "0.9",
+        "1.0.dev0",
+        "1.0a0.dev1",
+        "1.0a0",
+        "1.0a1",
+        "1.0a12",
+        "1.0b2.post3",
+        "1.0rc1",
+        "1.0",
+        "1.0.0.0",
+        "1.0+abc",
+        "1.0+abc.5",
+        "1.0+abcd",
+        "1.0+5",
+        "1.0+5.abc",
+        "1.0+12",
+        "1.0.post1.dev4",
+        "1.0.post1",
+        "1.0.post10",
+        "1.0.1",
+        "1.1",
+        "1.10",
+        "2.0.dev3",
+        "10",
+        "20240101",
+        "1!0.1",
+    ]
+]
+
+
+def test_version_key():
+    shuffled = versions.copy()
+    random.shuffle(shuffled)
+    assert sorted(shuffled, key=version_key) == sorted(shuffled)
+    assert version_key(Version("1.0")) == version_key(Version("1.0.0.0"))
+
+
+def test_sort_key():
+    # Plain release numbers skip the full parse but key the same way
+    for v in versions:
+        assert sort_key(str(v)) == version_key(v)
+    assert plain_version_key("1.2.3") is not None
+    assert plain_version_key("2.1.0.dev20240101") is not None
+    for s in ["1.0rc1", "1.01", "1.0.dev01", "v1.0", "1.0+abc", "1..0", "\u00b2"]:
+        assert plain_version_key(s) is None
+
+
+def test_iter_releases(tmp_cache):
+    con = get_local_con()
+    upload_time = datetime.datetime(2020, 1, 1, tzinfo=datetime.UTC)
+    records = [
+        (
+            ReleaseRecord(f"demo-{v}.tar.gz", str(v), upload_time, False, "", "src"),
+            version_key(v),
+        )
+        for v in versions
+    ]
+    replace_releases(con, "test", "demo", records)
+
+    res = iter_releases(con, ["test"], "demo", upload_time)
+    assert [Version(r.version) for r in res] == sorted(versions, reverse=True)
+    before = upload_time - datetime.timedelta(seconds=1)
+    assert list(iter_releases(con, ["test"], "demo", before)) == []
+
+
+def test_iter_releases__merged(tmp_cache):
+    con = get_local_con()
+    upload_time = datetime.datetime(2020, 1, 1, tzinfo=datetime.UTC)
+    for listing, vs in ("a", ["1.0", "3.0"]), ("b", ["2.0", "3.0"]):
+        records = [
+            (
+                ReleaseRecord(f"demo-{v}", v, upload_time, False, "", listing),
+                sort_key(v),
+            )
+            for v in vs
+        ]
+        replace_releases(con, listing, "demo", records)
+
+    res = iter_releases(con, ["b", "a"], "demo", upload_time)
+    assert [(r.version, r.source) for r in res] == [
+        ("3.0", "b"),
+        ("3.0", "a"),
+        ("2.0", "b"),
+        ("1.0", "a"),
+    ]
+
+    # Each listing is walked in index order, without sorting it first
+    plan = con.execute(f"EXPLAIN QUERY PLAN {releases_query}", ["a", "demo", 0])
+    assert not any("TEMP B-TREE" in row[-1] for row in plan)
@@ -0,0 +1,233 @@
+import datetime
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from conftest import FileServer, record
+from packaging.version import Version
+
+import asof
+from asof.conda import get_conda, get_conda_platforms
+from asof.db import get_local_con
+from asof.release_index import listing_digest
+from asof.repodata import iter_repodata_packages
+
+
+def write_repodata(file_server: FileServer, channel: str, subdir: str, files: dict):
+    path = file_server.root / channel / subdir / "repodata.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(
+        json.dumps(
+            {
+                "info": {"subdir": subdir},
+                "packages": {
+                    fn: obj for fn, obj in files.items() if fn.endswith(".tar.bz2")
+                },
+                "packages.conda": {
+                    fn: obj for fn, obj in files.items() if fn.endswith(".conda")
+                },
+            }
+        )
+    )
+
+
+@pytest.fixture
+def local_channel(tmp_cache, file_server: FileServer, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(asof, "conda_channel_baseurl", file_server.url)
+    monkeypatch.setattr(asof, "conda_channels", ["conda-forge"])
+    monkeypatch.setattr(asof, "conda_subdirs", ["linux-64", "noarch"])
+    # Skip the backends that depend on the local conda install
+    monkeypatch.setattr(asof, "conda_backends", ["shards", "repodata"])
+    write_repodata(
+        file_server,
+        "conda-forge",
+        "linux-64",
+        {
+            "demo-1.0-py_0.tar.bz2": record("demo", "1.0", "2020-01-01T00:00Z", "py_0"),
+            "demo-1.1-h1_0.conda": record("demo", "1.1", "2021-01-01T00:00Z"),
+            "demo-2.0rc1-h1_0.conda": record("demo", "2.0rc1", "2021-09-01T00:00Z"),
+            "other-3.0-h1_0.conda": record("other", "3.0", "2021-01-01T00:00Z"),
+        },
+    )
+    write_repodata(
+        file_server,
+        "conda-forge",
+        "noarch",
+        {
+            "demo-1.2-pyhd8ed1ab_0.conda": record(
+                "demo", "1.2", "2021-06-01T00:00Z", "pyhd8ed1ab_0"
+            ),
+        },
+    )
+    yield file_server
+
+
+@pytest.fixture
+def repodata_channel(local_channel: FileServer, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(asof, "conda_backends", ["repodata"])
+    yield local_channel
+
+
+def test_get_conda__repodata(repodata_channel: FileServer):
+    when = datetime.datetime.fromisoformat("2021-12-01T00:00:00Z")
+    res = get_conda(when, "demo", channels=["conda-forge"])
+    assert [(m.version, m.source) for m in res.matches] == [
+        (Version("2.0rc1"), "conda-forge"),
+        (Version("1.2"), "conda-forge"),
+    ]
+    assert res.message is None
+
+    # Both subdirs were fetched after the cutoff, so no network this time
+    res = get_conda(when, "demo", channels=["conda-forge"])
+    assert len(res.matches) == 2
+    assert len(repodata_channel.log) == 2
+
+
+def test_get_conda__shared_subdir(local_channel: FileServer):
+    when = datetime.datetime.fromisoformat("2021-12-01T00:00:00Z")
+    with ThreadPoolExecutor(4) as executor:
+        results = list(
+            executor.map(
+                lambda package: get_conda(when, package), ["demo", "other"] * 4
+            )
+        )
+    assert [r.matches[0].version for r in results[:2]] == [
+        Version("2.0rc1"),
+        Version("3.0"),
+    ]
+    # Each subdir's repodata was downloaded once, not once per package
+    fetched = [path for path, _ in local_channel.log if path.endswith(".json")]
+    assert sorted(fetched) == [
+        "/conda-forge/linux-64/repodata.json",
+        "/conda-forge/noarch/repodata.json",
+    ]
+
+
+def test_get_conda__repodata_empty(repodata_channel: FileServer):
+    when = datetime.datetime.fromisoformat("2019-12-01T00:00:00Z")
+    res = get_conda(when, "demo", channels=["conda-forge"])
+    assert res.matches == []
+    assert res.message == "No matches for demo available from conda-forge"
+
+
+def test_get_conda__default_backend(local_channel: FileServer):
+    when = datetime.datetime.fromisoformat("2020-06-01T00:00:00Z")
+    res = get_conda(when, "demo")
+    assert [m.version for m in res.matches] == [Version("1.0")]
+
+
+@pytest.mark.parametrize(
+    "channel_priority,expected",
+    [
+        # bioconda's newer demo is hidden because conda-forge has demo
+        ("strict", [(Version("1.2"), "conda-forge")]),
+        ("flexible", [(Version("1.5"), "bioconda")]),
+    ],
+)
+def test_get_conda__channel_priority(
+    local_channel: FileServer,
+    monkeypatch: pytest.MonkeyPatch,
+    channel_priority: str,
+    expected: list[tuple[Version, str]],
+):
+    monkeypatch.setattr(asof, "conda_channels", ["conda-forge", "bioconda"])
+    monkeypatch.setattr(asof, "conda_channel_priority", channel_priority)
+    # bioconda has no linux-64 subdir
+    write_repodata(
+        local_channel,
+        "bioconda",
+        "noarch",
+        {
+            "demo-1.5-py_0.tar.bz2": record("demo", "1.5", "2021-07-01T00:00Z", "py_0"),
+            "bio-1.0-py_0.tar.bz2": record("bio", "1.0", "2021-07-01T00:00Z", "py_0"),
+        },
+    )
+    when = datetime.datetime.fromisoformat("2021-08-01T00:00:00Z")
+    res = get_conda(when, "demo")
+    assert [(m.version, m.source) for m in res.matches] == expected
+
+    # Strict or not, a package only one channel has comes from that channel
+    res = get_conda(when, "bio")
+    assert [(m.version, m.source) for m in res.matches] == [
+        (Version("1.0"), "bioconda")
+    ]
+
+
+def test_get_conda__channel_unavailable(local_channel: FileServer):
+    when = datetime.datetime.fromisoformat("2021-08-01T00:00:00Z")
+    res = get_conda(when, "demo", channels=["conda-forge", "http://127.0.0.1:9"])
+    assert res.matches == []
+    assert res.message is not None
+
+
+def test_get_conda_platforms(local_channel: FileServer):
+    when = datetime.datetime.fromisoformat("2021-12-01T00:00:00Z")
+    res = get_conda_platforms(when, "demo", ["linux-64", "osx-arm64", "noarch"])
+    assert {
+        platform: [m.version for m in option.matches]
+        for platform, option in res.by_platform.items()
+    } == {
+        "linux-64": [Version("2.0rc1"), Version("1.2")],
+        # The channel has no osx-arm64 subdir, but noarch packages still count
+        "osx-arm64": [Version("1.2")],
+        "noarch": [Version("1.2")],
+    }
+
+    # Each subdir was fetched once, noarch included
+    repodata_paths = [path for path, _ in local_channel.log if "repodata.json" in path]
+    assert sorted(repodata_paths) == [
+        "/conda-forge/linux-64/repodata.json",
+        "/conda-forge/noarch/repodata.json",
+        "/conda-forge/osx-arm64/repodata.json",
+    ]
+
+
+def test_get_conda__specifier(local_channel: FileServer):
+    when = datetime.datetime.fromisoformat("2021-12-01T00:00:00Z")
+    res = get_conda(when, "demo", specifier="<1.2")
+    assert [m.version for m in res.matches] == [Version("1.1")]
+
+
+def test_iter_repodata_packages():
+    repodata = {
+        "info": {"subdir": "noarch"},
+        "packages": {"a-1.0-0.tar.bz2": {"name": "a", "depends": ["b >=1"]}},
+        "packages.conda": {
+            "b-1.0-0.conda": {"name": "b", "depends": []},
+            "c-1.0-0.conda": {"name": "c", "note": "}{,"},
+        },
+        "removed": ["d-1.0-0.tar.bz2"],
+        "repodata_version": 1,
+    }
+    expected = [*repodata["packages"].items(), *repodata["packages.conda"].items()]
+    for text in json.dumps(repodata), json.dumps(repodata, indent=2):
+        assert list(iter_repodata_packages(text)) == expected
+
+
+def test_get_conda__repodata_reindex(repodata_channel: FileServer):
+    now = datetime.datetime.now(datetime.UTC)
+    con = get_local_con()
+    get_conda(now, "demo", channels=["conda-forge"])
+    listing = f"{repodata_channel.url}/conda-forge/linux-64"
+    digest = listing_digest(con, listing)
+    assert digest is not None
+
+    # Unchanged upstream: revalidated but not re-indexed
+    get_conda(datetime.datetime.now(datetime.UTC), "demo", channels=["conda-forge"])
+    assert listing_digest(con, listing) == digest
+
+    write_repodata(
+        repodata_channel,
+        "conda-forge",
+        "linux-64",
+        {"demo-3.0-h1_0.conda": record("demo", "3.0", "2022-01-01T00:00Z")},
+    )
+    # Make sure the mtime (and so Last-Modified) moves forward
+    path = repodata_channel.root / "conda-forge" / "linux-64" / "repodata.json"
+    os.utime(path, (now.timestamp() + 10, now.timestamp() + 10))
+    res = get_conda(
+        datetime.datetime.now(datetime.UTC), "demo", channels=["conda-forge"]
+    )
+    assert [m.version for m in res.matches] == [Version("3.0")]
+    assert listing_digest(con, listing) != digest
@@ -0,0 +1,70 @@
+import datetime
+import sys
+from pathlib import Path
+
+import pytest
+from conftest import install_fake_conda
+from packaging.version import Version
+
+import asof
+from asof.conda import search_conda
+
+# The fake conda is a shebang script, which Windows (and so shutil.which)
+# won't run
+pytestmark = pytest.mark.skipif(
+    sys.platform == "win32", reason="fake conda needs shebang support"
+)
+
+
+def test_search_conda__cached(fake_conda: Path, monkeypatch: pytest.MonkeyPatch):
+    when = datetime.datetime(2022, 1, 1, tzinfo=datetime.UTC)
+    res = search_conda(when, "demo", "conda")
+    assert [m.version for m in res.matches] == [Version("1.0")]
+
+    # The search ran after the cutoff, so it can answer again however old
+    monkeypatch.setattr(asof, "conda_search_lifetime", datetime.timedelta(0))
+    res = search_conda(when, "demo", "conda")
+    assert [m.version for m in res.matches] == [Version("1.0")]
+    assert len(fake_conda.read_text().splitlines()) == 1
+
+    # A cutoff after the search is answered from the cache within the lifetime
+    later = datetime.datetime.now(datetime.UTC) + datetime.timedelta(days=1)
+    monkeypatch.setattr(asof, "conda_search_lifetime", datetime.timedelta(hours=1))
+    res = search_conda(later, "demo", "conda")
+    assert [m.version for m in res.matches] == [Version("2.0")]
+    assert len(fake_conda.read_text().splitlines()) == 1
+
+    # But not once the lifetime has passed
+    monkeypatch.setattr(asof, "conda_search_lifetime", datetime.timedelta(0))
+    search_conda(later, "demo", "conda")
+    assert len(fake_conda.read_text().splitlines()) == 2
+
+
+def test_search_conda__keyed_on_channels(fake_conda: Path):
+    when = datetime.datetime(2022, 1, 1, tzinfo=datetime.UTC)
+    search_conda(when, "demo", "conda")
+    search_conda(when, "demo", "conda", channels=["bioconda"], subdir="noarch")
+    search_conda(when, "demo", "conda", channels=["bioconda"], subdir="noarch")
+    search_conda(when, "demo", "conda", recheck_yanked=True)
+
+    searches = fake_conda.read_text().splitlines()
+    assert searches == [
+        "search --json demo --skip-flexible-search",
+        "search --json --channel bioconda --override-channels --platform noarch demo --skip-flexible-search",
+        "search --json demo --skip-flexible-search",
+    ]
+
+
+def test_search_conda__path_changed(
+    fake_conda: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    when = datetime.datetime(2022, 1, 1, tzinfo=datetime.UTC)
+    search_conda(when, "demo", "conda")
+
+    # Another environment's conda comes first on the PATH now; its search
+    # is a different listing, and it's the one that runs
+    other = install_fake_conda(tmp_path / "other", monkeypatch, "conda 25.1.0")
+    res = search_conda(when, "demo", "conda")
+    assert [m.version for m in res.matches] == [Version("1.0")]
+    assert len(fake_conda.read_text().splitlines()) == 1
+    assert len(other.read_text().splitlines()) == 1
@@ -0,0 +1,72 @@
+import datetime
+
+import pytest
+from packaging.version import Version
+
+from asof.release_index import ReleaseRecord
+from asof.selection import (
+    PrereleasePolicy,
+    select_newest,
+    select_newest_by_mask,
+    specifier_filter,
+)
+
+upload_time = datetime.datetime(2020, 1, 1, tzinfo=datetime.UTC)
+
+# Newest first, as iter_releases gives them
+records = [
+    ReleaseRecord(f"demo-{v}.tar.gz", v, upload_time, False, "", "src")
+    for v in ["2.0rc2", "2.0rc1", "1.5", "1.4", "1.0"]
+]
+
+
+@pytest.mark.parametrize(
+    "prereleases,expected",
+    [
+        ("newer", ["2.0rc2", "1.5"]),
+        ("never", ["1.5"]),
+        ("always", ["2.0rc2"]),
+    ],
+)
+def test_select_newest(prereleases: PrereleasePolicy, expected: list[str]):
+    res = select_newest("demo", records, prereleases=prereleases)
+    assert [m.version for m in res] == [Version(v) for v in expected]
+
+
+def test_select_newest__filters():
+    not_rc2 = lambda r: r.version != "2.0rc2"
+    res = select_newest("demo", records, [not_rc2], prereleases="newer")
+    assert [m.version for m in res] == [Version("2.0rc1"), Version("1.5")]
+
+    res = select_newest("demo", records, [specifier_filter("<1.5")])
+    assert [m.version for m in res] == [Version("1.4")]
+
+    # Specifiers leave prereleases to the policy
+    res = select_newest("demo", records, [specifier_filter(">=2.0.dev0")])
+    assert [m.version for m in res] == [Version("2.0rc2")]
+
+
+def test_select_newest__lazy():
+    def fail_after_first_release():
+        yield from records[:3]
+        pytest.fail("walked past the newest release")
+
+    res = select_newest("demo", fail_after_first_release(), prereleases="newer")
+    assert len(res) == 2
+
+
+def test_select_newest_by_mask():
+    # Target 0 takes everything, target 1 only 1.x
+    masked: list[str] = []
+
+    def mask(record: ReleaseRecord) -> int:
+        masked.append(record.version)
+        return 0b11 if record.version.startswith("1.") else 0b01
+
+    res = select_newest_by_mask("demo", records, 2, mask, prereleases="newer")
+    assert [[m.version for m in ms] for ms in res] == [
+        [Version("2.0rc2"), Version("1.5")],
+        [Version("1.5")],
+    ]
+    # One walk, one mask per record, stopping once both targets are done
+    assert masked == ["2.0rc2", "2.0rc1", "1.5"]
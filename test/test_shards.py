@@ -0,0 +1,106 @@
+import datetime
+import hashlib
+from pathlib import Path
+
+import pytest
+from conftest import FileServer, record
+from packaging.version import Version
+
+import asof
+from asof.conda import get_conda
+
+msgpack = pytest.importorskip("msgpack")
+zstandard = pytest.importorskip("zstandard")
+
+
+def pack(obj) -> bytes:
+    return zstandard.ZstdCompressor().compress(msgpack.packb(obj))
+
+
+def write_shards(
+    subdir: Path, packages: dict[str, dict], shards_base_url: str | None = "./shards"
+):
+    """Write a shard index plus one shard per package."""
+    (subdir / "shards").mkdir(parents=True)
+    hashes = {}
+    for name, files in packages.items():
+        shard = pack({"packages": {}, "packages.conda": files, "removed": []})
+        shard_hash = hashlib.sha256(shard).digest()
+        (subdir / "shards" / f"{shard_hash.hex()}.msgpack.zst").write_bytes(shard)
+        hashes[name] = shard_hash
+    index = {
+        "version": 1,
+        "info": {"base_url": "./", "shards_base_url": shards_base_url},
+        "shards": hashes,
+    }
+    (subdir / "repodata_shards.msgpack.zst").write_bytes(pack(index))
+
+
+@pytest.fixture
+def sharded_channel(
+    tmp_cache, file_server: FileServer, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(asof, "conda_channel_baseurl", file_server.url)
+    monkeypatch.setattr(asof, "conda_subdirs", ["linux-64"])
+    # Skip the backends that depend on the local conda install
+    monkeypatch.setattr(asof, "conda_backends", ["shards", "repodata"])
+    write_shards(
+        file_server.root / "conda-forge" / "linux-64",
+        {
+            "demo": {
+                "demo-1.0-h1_0.conda": record(
+                    "demo", "1.0", "2020-01-01T00:00Z", sha256=bytes(32)
+                ),
+                "demo-2.0-h1_0.conda": record(
+                    "demo", "2.0", "2022-01-01T00:00Z", sha256=bytes(32)
+                ),
+            },
+            "other": {
+                "other-1.0-h1_0.conda": record(
+                    "other", "1.0", "2020-01-01T00:00Z", sha256=bytes(32)
+                ),
+            },
+        },
+    )
+    yield file_server
+
+
+def test_get_conda__shards(
+    sharded_channel: FileServer, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(asof, "conda_backends", ["shards"])
+    when = datetime.datetime.fromisoformat("2021-01-01T00:00:00Z")
+    res = get_conda(when, "demo", channels=["conda-forge"])
+    assert [m.version for m in res.matches] == [Version("1.0")]
+
+    # Only the index and the one shard were downloaded
+    assert len(sharded_channel.log) == 2
+    assert sharded_channel.log[1][0].startswith("/conda-forge/linux-64/shards/")
+
+    # Shards are immutable, so a revalidated index means no shard download
+    now = datetime.datetime.now(datetime.UTC)
+    res = get_conda(now, "demo", channels=["conda-forge"])
+    assert [m.version for m in res.matches] == [Version("2.0")]
+    assert [status for _, status in sharded_channel.log[2:]] == [304]
+
+    res = get_conda(when, "missing", channels=["conda-forge"])
+    assert res.matches == []
+
+
+def test_get_conda__prefers_shards(sharded_channel: FileServer):
+    when = datetime.datetime.fromisoformat("2021-01-01T00:00:00Z")
+    res = get_conda(when, "other")
+    assert [m.version for m in res.matches] == [Version("1.0")]
+    assert not any("repodata.json" in path for path, _ in sharded_channel.log)
+
+
+def test_get_conda__shards_no_base_url(
+    sharded_channel: FileServer, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(asof, "conda_backends", ["shards"])
+    subdir = sharded_channel.root / "conda-forge" / "osx-64"
+    write_shards(subdir, {"demo": {}}, shards_base_url=None)
+    when = datetime.datetime.fromisoformat("2021-01-01T00:00:00Z")
+    res = get_conda(when, "demo", channels=["conda-forge"], subdirs=["osx-64"])
+    assert res.matches == []
+    assert res.message is not None and "has no shards_base_url" in res.message
@@ -0,0 +1,43 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from asof.single_flight import in_flight, single_flight
+
+
+def test_single_flight():
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def fetch() -> str:
+        calls.append(None)
+        started.set()
+        release.wait()
+        return "listing"
+
+    with ThreadPoolExecutor(4) as executor:
+        first = executor.submit(single_flight, "key", fetch)
+        started.wait()
+        others = [executor.submit(single_flight, "key", fetch) for _ in range(3)]
+        # Give the others time to start waiting on the first
+        time.sleep(0.2)
+        release.set()
+        assert [f.result() for f in [first, *others]] == ["listing"] * 4
+    assert len(calls) == 1
+    assert not in_flight
+
+    # Once the first call is done, a new one runs again
+    assert single_flight("key", fetch) == "listing"
+    assert len(calls) == 2
+
+
+def test_single_flight__exception():
+    def fail() -> str:
+        raise ValueError("unavailable")
+
+    with pytest.raises(ValueError):
+        single_flight("key", fail)
+    assert not in_flight
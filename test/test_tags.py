@@ -0,0 +1,64 @@
+import pytest
+from packaging.tags import Tag, sys_tags
+
+import asof.tags
+from asof.tags import host_target, parse_target, platform_tags, target_bitsets
+
+
+def test_parse_target():
+    target = parse_target("cp311-manylinux_2_28_x86_64")
+    assert Tag("cp311", "cp311", "manylinux_2_28_x86_64") in target.tags
+    assert Tag("cp311", "abi3", "manylinux2014_x86_64") in target.tags
+    assert Tag("cp38", "abi3", "manylinux1_x86_64") in target.tags
+    assert Tag("py3", "none", "any") in target.tags
+    assert Tag("cp311", "cp311", "manylinux_2_29_x86_64") not in target.tags
+    assert Tag("cp312", "cp312", "manylinux_2_28_x86_64") not in target.tags
+
+    # Free-threaded builds can't load abi3 extensions
+    target = parse_target("cp313t-win_amd64")
+    assert Tag("cp313", "cp313t", "win_amd64") in target.tags
+    assert Tag("cp313", "abi3", "win_amd64") not in target.tags
+
+
+@pytest.mark.parametrize("target", ["manylinux_2_28_x86_64", "cp311", "311-any"])
+def test_parse_target__invalid(target: str):
+    with pytest.raises(ValueError):
+        parse_target(target)
+
+
+def test_platform_tags():
+    assert platform_tags("manylinux_2_18_aarch64") == [
+        "manylinux_2_18_aarch64",
+        "manylinux_2_17_aarch64",
+        "manylinux2014_aarch64",
+        "linux_aarch64",
+    ]
+    assert platform_tags("musllinux_1_1_x86_64") == [
+        "musllinux_1_1_x86_64",
+        "musllinux_1_0_x86_64",
+        "linux_x86_64",
+    ]
+    assert "macosx_11_0_arm64" in platform_tags("macosx_14_0_arm64")
+    assert platform_tags("win_amd64") == ["win_amd64"]
+
+
+def test_target_bitsets():
+    bitsets = target_bitsets(
+        ("cp311-manylinux_2_28_x86_64", "cp312-macosx_14_0_arm64", "cp312-win_amd64")
+    )
+    assert bitsets.mask("py3-none-any") == 0b111
+    assert bitsets.mask("cp311-cp311-manylinux_2_17_x86_64.manylinux2014_x86_64") == 1
+    assert bitsets.mask("cp39-abi3-macosx_11_0_arm64.win_amd64") == 0b110
+    assert bitsets.mask("cp310-cp310-win_amd64") == 0
+
+
+def test_host_target(tmp_cache, monkeypatch: pytest.MonkeyPatch):
+    host_target.cache_clear()
+    tags = host_target().tags
+    assert tags == frozenset(sys_tags())
+
+    # Later runs load the tag set from the cache DB instead of generating it
+    host_target.cache_clear()
+    monkeypatch.setattr(asof.tags, "sys_tags", lambda: pytest.fail("regenerated"))
+    assert host_target().tags == tags
+    host_target.cache_clear()
@@ -0,0 +1,130 @@
+import threading
+import time
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import asof
+from asof import transport
+from asof.transport import HostLimiter
+
+
+class FlakyServer(ThreadingHTTPServer):
+    # Statuses to answer with, in order; 200 once they run out
+    statuses: list[int]
+    ports: set[int]
+    retry_after: str | None
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    server: FlakyServer
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        # Remember the client port to tell whether connections are reused
+        self.server.ports.add(self.client_address[1])
+        code = self.server.statuses.pop(0) if self.server.statuses else 200
+        body = self.headers.get("Accept-Encoding", "").encode()
+        self.send_response(code)
+        if code != 200 and self.server.retry_after is not None:
+            self.send_header("Retry-After", self.server.retry_after)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def flaky_server(monkeypatch: pytest.MonkeyPatch) -> Iterator[FlakyServer]:
+    monkeypatch.setattr(asof, "http_backoff", 0.0)
+    server = FlakyServer(("127.0.0.1", 0), FlakyHandler)
+    server.statuses = []
+    server.ports = set()
+    server.retry_after = None
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_get__keep_alive(flaky_server: FlakyServer):
+    url = f"http://127.0.0.1:{flaky_server.server_port}/"
+    for _ in range(3):
+        resp = transport.get(url)
+        assert resp.ok
+        assert "gzip" in resp.text
+    assert len(flaky_server.ports) == 1
+
+
+def test_get__retry(flaky_server: FlakyServer):
+    flaky_server.statuses = [503, 502]
+    resp = transport.get(f"http://127.0.0.1:{flaky_server.server_port}/")
+    assert resp.status_code == 200
+    assert flaky_server.statuses == []
+
+
+def test_get__retries_exhausted(
+    flaky_server: FlakyServer, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(asof, "http_retries", 1)
+    flaky_server.statuses = [503, 503, 503]
+    resp = transport.get(f"http://127.0.0.1:{flaky_server.server_port}/")
+    assert resp.status_code == 503
+    assert flaky_server.statuses == [503]
+
+
+def test_get_session__per_thread():
+    session = transport.get_session()
+    assert transport.get_session() is session
+
+    other: list = []
+    thread = threading.Thread(target=lambda: other.append(transport.get_session()))
+    thread.start()
+    thread.join()
+    assert other[0] is not session
+
+
+def test_get__retry_after(flaky_server: FlakyServer):
+    flaky_server.statuses = [429]
+    flaky_server.retry_after = "1"
+    start = time.monotonic()
+    resp = transport.get(f"http://127.0.0.1:{flaky_server.server_port}/")
+    assert resp.status_code == 200
+    assert time.monotonic() - start >= 1
+    assert transport.host_limiter(resp.url).limit < asof.http_max_concurrency
+
+
+def test_get__rate_limit(flaky_server: FlakyServer, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(asof, "http_rate_limit", 10.0)
+    start = time.monotonic()
+    # A burst of 10, then one every 0.1 seconds
+    for _ in range(13):
+        transport.get(f"http://127.0.0.1:{flaky_server.server_port}/")
+    assert time.monotonic() - start >= 0.25
+
+
+def test_host_limiter__aimd(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(asof, "http_max_concurrency", 8)
+    limiter = HostLimiter()
+    throttled = requests.Response()
+    throttled.status_code = 503
+    ok = requests.Response()
+    ok.status_code = 200
+
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(throttled)
+    assert limiter.limit == 1
+
+    for _ in range(10):
+        limiter.acquire()
+        limiter.release(ok)
+    assert 3 < limiter.limit < 8
+    assert limiter.in_flight == 0